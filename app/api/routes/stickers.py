@@ -1,4 +1,6 @@
 """Sticker routes."""
+from typing import Optional
+
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
 
@@ -14,10 +16,18 @@ from app.models.requests import (
 )
 
 
-def create_sticker_router(cache_manager: CacheManager) -> APIRouter:
-    """Create sticker router with cache manager dependency."""
+def create_sticker_router(
+    cache_manager: CacheManager,
+    handler: Optional[StickerHandler] = None
+) -> APIRouter:
+    """Create sticker router with cache manager dependency.
+    
+    The app passes its own handler so it can close the handler's
+    services on shutdown.
+    """
     router = APIRouter()
-    handler = StickerHandler(cache_manager)
+    if handler is None:
+        handler = StickerHandler(cache_manager)
     
     @router.get(
         "/stickers/{file_id}",
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -12,6 +12,21 @@ class Settings(BaseSettings):
     
     # OpenAI Configuration
     openai_api_key: Optional[str] = None
+    openai_http2: bool = True  # Multiplex concurrent OpenAI calls over HTTP/2 (needs httpx[http2])
+    webp_encode_method: int = 4  # libwebp effort (0-6) for generated sticker encodes
+    webp_encode_quality: int = 90  # Lossy WebP quality for generated sticker encodes
+    webp_adaptive_lossless: bool = True  # Encode flat, few-colour stickers as lossless WebP
+    use_fast_reduce: bool = True  # Box-reduce exact 2x/3x/... downscales instead of Lanczos
+    # Sizes each image model can return directly; other sizes are generated
+    # at 1024x1024 and scaled down
+    openai_native_sizes: Dict[str, List[str]] = {
+        "dall-e-2": ["256x256", "512x512", "1024x1024"],
+        "dall-e-3": ["1024x1024", "1792x1024", "1024x1792"],
+        "gpt-image-1": ["1024x1024", "1536x1024", "1024x1536"],
+    }
+    openai_response_format: str = "b64_json"  # "b64_json" (inline) or "url" (download, no base64 decode)
+    openai_max_concurrent_generations: int = 4  # In-flight calls per bulk generate_stickers()
+    openai_generation_cache_mb: int = 32  # In-process cache of generated images per (model, prompt, size); 0 disables
 
     # WaveSpeed Configuration
     wavespeed_api_key: Optional[str] = None
@@ -22,6 +37,7 @@ class Settings(BaseSettings):
     # RunPod API Configuration
     runpod_api_url: str = "https://api.runpod.ai/v2/5ecx4u5xss6vi6/run"
     runpod_api_token: Optional[str] = None  # Bearer token for RunPod API authorization
+    runpod_api_detailed_logging: bool = True  # Log full RunPod request/response payloads at DEBUG
     
     # Redis Configuration
     redis_enabled: bool = True  # Enable/disable Redis cache entirely
@@ -31,6 +47,7 @@ class Settings(BaseSettings):
     redis_database: int = 1
     redis_ssl_enabled: bool = False
     redis_max_connections: int = 50
+    redis_pool_timeout: int = 5  # Seconds to wait for a free pooled connection
     redis_socket_keepalive: bool = True
     redis_socket_connect_timeout: int = 5
     
@@ -76,6 +93,8 @@ class Settings(BaseSettings):
     disk_cache_ttl_days: int = 30  # TTL for disk cache files
     disk_cache_cleanup_interval_hours: int = 24  # How often to run cleanup
     disk_cache_enabled: bool = True  # Enable/disable disk cache
+    disk_cache_fadvise_dontneed: bool = False  # Opt-in: drop read files from the page cache (one-shot bulk reads)
+    disk_cache_io_concurrency: int = 32  # Max concurrent disk cache file operations
     
     # Retry Configuration
     max_retries: int = 3  # Maximum retry attempts for API calls
@@ -74,6 +74,15 @@ class StickerHandler:
             self._wavespeed_service = WaveSpeedGenerationService()
         return self._wavespeed_service
 
+    async def close(self):
+        """Close the HTTP clients of the generation services created so far."""
+        for service in (self._openai_service, self._runpod_service, self._wavespeed_service):
+            if service is not None:
+                try:
+                    await service.close()
+                except Exception as e:
+                    logger.warning(f"Error closing {type(service).__name__}: {e}")
+
     @property
     def wavespeed_registry(self) -> WaveSpeedRegistryService:
         """Lazy initialization of WaveSpeed metadata registry."""
@@ -571,11 +580,7 @@ class StickerHandler:
                     detail=f"OpenAI service is not available: {str(e)}. Please configure OPENAI_API_KEY in environment variables."
                 )
             
-            # Run OpenAI API call in thread pool since it's synchronous
-            loop = asyncio.get_event_loop()
-            image_bytes = await loop.run_in_executor(
-                None,
-                openai_service.generate_sticker,
+            image_bytes = await openai_service.generate_sticker(
                 request.prompt,
                 request.model,
                 request.quality,
@@ -584,8 +589,8 @@ class StickerHandler:
             
             processing_time = int((time.time() - start_time) * 1000)
             logger.info(
-                f"Generated sticker: prompt='{request.prompt[:50]}...', "
-                f"size={len(image_bytes)} bytes, time={processing_time}ms"
+                "Generated sticker: prompt='%.50s...', size=%d bytes, time=%dms",
+                request.prompt, len(image_bytes), processing_time
             )
             
             return StreamingResponse(
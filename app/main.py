@@ -9,6 +9,7 @@ from fastapi.responses import JSONResponse
 from app.config import settings
 from app.services.cache_manager import CacheManager
 from app.services.webhook_db import WebhookDBService
+from app.handlers.sticker_handler import StickerHandler
 from app.middleware.rate_limit import RateLimitMiddleware
 from app.api.routes import health, stickers, cache, stats, snapstix, images
 
@@ -50,6 +51,9 @@ cache_manager = CacheManager()
 # Initialize webhook database service
 webhook_db = WebhookDBService()
 
+# Initialize sticker handler (owns the OpenAI/RunPod/WaveSpeed clients)
+sticker_handler = StickerHandler(cache_manager)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -72,6 +76,7 @@ async def lifespan(app: FastAPI):
     # Shutdown
     await cache_manager.disconnect()
     await webhook_db.disconnect()
+    await sticker_handler.close()
     logger.info("Sticker Processor Service stopped")
 
 
@@ -161,7 +166,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 # Register routes
 app.include_router(health.router)
-app.include_router(stickers.create_sticker_router(cache_manager))
+app.include_router(stickers.create_sticker_router(cache_manager, sticker_handler))
 app.include_router(images.create_images_router(cache_manager))
 app.include_router(cache.create_cache_router(cache_manager))
 app.include_router(stats.create_stats_router(cache_manager))
@@ -1,20 +1,195 @@
 import os
 import hashlib
 import shutil
+import functools
+import mmap
+import uuid
 import asyncio
 import logging
-from collections import defaultdict
+import time
+from collections import OrderedDict, defaultdict
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime
 import socket
-import aiofiles
 import aiosqlite
 
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Bump when the cache_metadata layout changes; stored in PRAGMA user_version.
+# v1: created_at/expires_at stored as epoch seconds (REAL) instead of ISO strings.
+METADATA_SCHEMA_VERSION = 1
+
+SECONDS_PER_DAY = 86400
+
+# How long get_cache_stats may serve the incrementally maintained counters
+# before re-aggregating the metadata index (other workers share the same DB).
+STATS_RESCAN_INTERVAL_SECONDS = 60
+
+# Entries whose expires_at is memoized in-process so get_file hits skip the index lookup
+EXPIRY_CACHE_MAX_ENTRIES = 50000
+
+# Prefix of directories that clear_cache() has detached and is deleting in the background
+TRASH_DIR_PREFIX = ".trash-"
+
+# Number of executor threads a cleanup batch is spread across when unlinking
+UNLINK_WORKERS = 8
+
+
+@functools.lru_cache(maxsize=16384)
+def _file_id_hash(file_id: str) -> str:
+    # MD5 is kept because the digest is the on-disk name of every cached file
+    # (and the file_hash column); memoizing removes the per-call hashing cost
+    # for hot file_ids without orphaning existing entries.
+    return hashlib.md5(file_id.encode()).hexdigest()
+
+
+def _read_bytes(path: Path, drop_cache: bool = False) -> bytes:
+    """Read a whole cache file (run via asyncio.to_thread).
+    
+    With drop_cache the file's pages are released from the page cache after
+    the read: stickers are read once and sent out, so keeping them only
+    evicts hotter pages.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        chunks = []
+        while size > 0:
+            chunk = os.read(fd, size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        if drop_cache and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        return b"".join(chunks)
+    finally:
+        os.close(fd)
+
+
+def _map_file(path: Path) -> memoryview:
+    """Map a cache file read-only (run via asyncio.to_thread).
+    
+    Safe because cache files are created atomically and never rewritten in
+    place, so the mapping cannot be truncated underneath a reader.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if os.fstat(fd).st_size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(fd, 0, access=mmap.ACCESS_READ))
+    finally:
+        os.close(fd)
+
+
+def _sendfile(path: Path, out_fd: int, offset: int, count: Optional[int]) -> int:
+    """Copy a cache file to out_fd in the kernel (run via asyncio.to_thread)."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if count is None:
+            count = os.fstat(fd).st_size - offset
+        sent = 0
+        while sent < count:
+            n = os.sendfile(out_fd, fd, offset + sent, count - sent)
+            if n == 0:
+                break
+            sent += n
+        return sent
+    finally:
+        os.close(fd)
+
+
+def _write_all(fd: int, content: bytes) -> None:
+    view = memoryview(content)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _link_tmpfile(path: Path, content: bytes) -> Optional[bool]:
+    """Write content to an unnamed O_TMPFILE inode and link it in as path.
+    
+    Returns True when linked, False if path already exists, or None when
+    O_TMPFILE/linkat is unavailable here (platform, filesystem or /proc).
+    """
+    tmpfile_flag = getattr(os, "O_TMPFILE", None)
+    if tmpfile_flag is None:
+        return None
+    try:
+        fd = os.open(path.parent, tmpfile_flag | os.O_WRONLY, 0o644)
+    except OSError:
+        return None
+    try:
+        _write_all(fd, content)
+        os.link(f"/proc/self/fd/{fd}", path)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def _write_bytes(path: Path, content: bytes) -> bool:
+    """Atomically create a cache file (run via asyncio.to_thread).
+    
+    Readers never observe a partially written file. Returns False if another
+    writer created path first, in which case it is left untouched.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    linked = _link_tmpfile(path, content)
+    if linked is not None:
+        return linked
+    
+    # Fallback: write under a unique temporary name, then hard-link into place
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp_path.write_bytes(content)
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _unlink_files(paths: List[Path]) -> int:
+    """Unlink a batch of cache files (run via asyncio.to_thread).
+    
+    Returns how many files were removed; files that are already gone are skipped.
+    """
+    removed = 0
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed
+
+
+def _detach_cache_dirs(cache_dir: Path, trash_dir: Path, format_dirs: List[str]) -> None:
+    """Move the given format directories into trash_dir (run via asyncio.to_thread).
+    
+    Only directories this cache writes are moved, plus leftover trash from
+    an interrupted clear: cache_dir may be shared (e.g. with the metadata
+    DB or other services), so anything else stays in place.
+    """
+    trash_dir.mkdir()
+    names = set(format_dirs)
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.path == str(trash_dir) or not entry.is_dir(follow_symlinks=False):
+                continue
+            if entry.name in names or entry.name.startswith(TRASH_DIR_PREFIX):
+                os.rename(entry.path, trash_dir / entry.name)
+
 
 class DiskCacheService:
     """Service for managing disk-based file cache with TTL and cleanup."""
@@ -24,6 +199,10 @@ class DiskCacheService:
         self.max_cache_size_mb = settings.disk_cache_max_size_mb
         self.ttl_days = settings.disk_cache_ttl_days
         self.cleanup_interval_hours = settings.disk_cache_cleanup_interval_hours
+        self.fadvise_dontneed = settings.disk_cache_fadvise_dontneed
+        # Bounds threads tied up in file I/O so bursts queue here rather than
+        # saturating the default executor shared with the rest of the app
+        self._io_sem = asyncio.Semaphore(settings.disk_cache_io_concurrency or 32)
         
         # Ensure cache directory exists
         self.cache_dir.mkdir(parents=True, exist_ok=True)
@@ -44,7 +223,15 @@ class DiskCacheService:
             'last_cleanup': None,
             'last_error': None,
             'last_error_at': None,
+            'file_types': defaultdict(int),
         }
+        self._stats_rescanned_at: Optional[float] = None
+        
+        # (file_id, file_format) -> expires_at, LRU-bounded by EXPIRY_CACHE_MAX_ENTRIES
+        self._expiry_cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        
+        # Background removals started by clear_cache() (kept referenced until done)
+        self._trash_tasks: set = set()
         
         logger.info(f"Disk cache initialized: {self.cache_dir}")
         logger.info(f"Max cache size: {self.max_cache_size_mb} MB")
@@ -52,7 +239,23 @@ class DiskCacheService:
     
     def _get_file_hash(self, file_id: str) -> str:
         """Generate a hash for the file ID to use as filename."""
-        return hashlib.md5(file_id.encode()).hexdigest()
+        return _file_id_hash(file_id)
+    
+    async def _run_io(self, func, *args):
+        """Run a blocking file operation in a worker thread under the I/O limit."""
+        async with self._io_sem:
+            return await asyncio.to_thread(func, *args)
+    
+    def _remember_expiry(self, file_id: str, file_format: str, expires_at: float) -> None:
+        """Memoize an entry's expiry so later hits can skip the metadata query."""
+        key = (file_id, file_format)
+        self._expiry_cache[key] = expires_at
+        self._expiry_cache.move_to_end(key)
+        if len(self._expiry_cache) > EXPIRY_CACHE_MAX_ENTRIES:
+            self._expiry_cache.popitem(last=False)
+    
+    def _forget_expiry(self, file_id: str, file_format: str) -> None:
+        self._expiry_cache.pop((file_id, file_format), None)
     
     def _get_metadata_db_path(self) -> Path:
         """Determine path to SQLite database.
@@ -71,13 +274,16 @@ class DiskCacheService:
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         return self.cache_dir / "sticker_cache_metadata.db"
     
-    def _get_cache_path(self, file_id: str, file_format: str) -> Path:
+    def _get_cache_path(self, file_id: str, file_format: str,
+                        file_hash: Optional[str] = None) -> Path:
         """Get the cache file path with hierarchical structure.
         
         Uses 2-level hierarchy: format/hash[0:2]/hash[2:4]/filename
         This distributes 50k files across ~256 directories for better FS performance.
+        A precomputed file_hash may be passed to skip hashing the file_id again.
         """
-        file_hash = self._get_file_hash(file_id)
+        if file_hash is None:
+            file_hash = self._get_file_hash(file_id)
         # Create hierarchical structure: format/hash[0:2]/hash[2:4]/filename
         format_dir = self.cache_dir / file_format
         subdir1 = format_dir / file_hash[:2]
@@ -85,14 +291,14 @@ class DiskCacheService:
         return subdir2 / f"{file_hash}.{file_format}"
     
     async def _ensure_db_connection(self):
-        """Ensure database connection is active."""
+        """Ensure database connection is open.
+        
+        The connection is to a local SQLite file and is only dropped by
+        close_db(), so no per-call liveness probe is issued: every cache
+        operation costs exactly the statements it needs.
+        """
         if self._metadata_db is None:
             await self._init_metadata_db()
-        # Reconnect if connection lost
-        try:
-            await self._metadata_db.execute("SELECT 1")
-        except Exception:
-            await self._init_metadata_db()
     
     async def _init_metadata_db(self):
         """Initialize SQLite database for metadata."""
@@ -100,7 +306,34 @@ class DiskCacheService:
             self._db_path = self._get_metadata_db_path()
             self._metadata_db = await aiosqlite.connect(str(self._db_path))
             
-            # Create table for cache metadata
+            # WAL appends to one long-lived -wal file instead of creating and
+            # unlinking a rollback journal on every per-entry commit.
+            # synchronous=NORMAL drops the per-commit fsync; a crash can lose
+            # the last few entries, which is acceptable for a cache index.
+            await self._metadata_db.execute("PRAGMA journal_mode=WAL")
+            await self._metadata_db.execute("PRAGMA synchronous=NORMAL")
+            
+            # Take the write lock before reading the schema version, so when
+            # several workers start together only the first one migrates and
+            # the others wait, then see the version it committed
+            await self._metadata_db.execute("BEGIN IMMEDIATE")
+            async with self._metadata_db.execute("PRAGMA user_version") as cursor:
+                row = await cursor.fetchone()
+                schema_version = row[0] if row else 0
+            
+            legacy_table = None
+            if schema_version < METADATA_SCHEMA_VERSION:
+                async with self._metadata_db.execute("""
+                    SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'cache_metadata'
+                """) as cursor:
+                    if await cursor.fetchone():
+                        # Move the old table aside; rows are copied over below
+                        legacy_table = "cache_metadata_legacy"
+                        await self._metadata_db.execute(
+                            f"ALTER TABLE cache_metadata RENAME TO {legacy_table}"
+                        )
+            
+            # Create table for cache metadata (timestamps are epoch seconds)
             await self._metadata_db.execute("""
                 CREATE TABLE IF NOT EXISTS cache_metadata (
                     file_id TEXT NOT NULL,
@@ -109,12 +342,25 @@ class DiskCacheService:
                     size INTEGER NOT NULL,
                     original_size INTEGER,
                     converted INTEGER DEFAULT 0,
-                    created_at TEXT NOT NULL,
-                    expires_at TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
                     PRIMARY KEY (file_id, file_format)
                 )
             """)
             
+            if legacy_table:
+                # ISO strings were written with naive local time (datetime.now())
+                await self._metadata_db.execute(f"""
+                    INSERT OR REPLACE INTO cache_metadata
+                    (file_id, file_hash, file_format, size, original_size, converted, created_at, expires_at)
+                    SELECT file_id, file_hash, file_format, size, original_size, converted,
+                           CAST(strftime('%s', created_at, 'utc') AS REAL),
+                           CAST(strftime('%s', expires_at, 'utc') AS REAL)
+                    FROM {legacy_table}
+                """)
+                await self._metadata_db.execute(f"DROP TABLE {legacy_table}")
+                logger.info("Migrated disk cache metadata timestamps to epoch seconds")
+            
             # Create indexes for fast queries
             await self._metadata_db.execute("""
                 CREATE INDEX IF NOT EXISTS idx_expires_at ON cache_metadata(expires_at)
@@ -126,10 +372,19 @@ class DiskCacheService:
                 CREATE INDEX IF NOT EXISTS idx_file_hash ON cache_metadata(file_hash)
             """)
             
+            await self._metadata_db.execute(f"PRAGMA user_version = {METADATA_SCHEMA_VERSION}")
             await self._metadata_db.commit()
             logger.info(f"SQLite metadata database initialized: {self._db_path}")
         except Exception as e:
             logger.error(f"Error initializing metadata database: {e}")
+            # Drop the half-initialized connection (rolling back the migration)
+            # so the next operation retries the initialization
+            if self._metadata_db is not None:
+                try:
+                    await self._metadata_db.close()
+                except Exception:
+                    pass
+                self._metadata_db = None
             raise
     
     async def close_db(self):
@@ -145,24 +400,18 @@ class DiskCacheService:
         try:
             await self._ensure_db_connection()
             
-            cache_path = self._get_cache_path(file_id, file_format)
-            
-            # Ensure directory exists
-            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            file_hash = self._get_file_hash(file_id)
+            cache_path = self._get_cache_path(file_id, file_format, file_hash)
             
-            # Check if file already exists
-            if cache_path.exists():
+            # Write file content atomically in a single thread hop; losing a
+            # race with a concurrent writer of the same entry is not an error
+            if not await self._run_io(_write_bytes, cache_path, content):
                 logger.debug(f"File {file_id} already exists in disk cache")
                 return True
             
-            # Write file content
-            async with aiofiles.open(cache_path, 'wb') as f:
-                await f.write(content)
-            
             # Store metadata in database
-            file_hash = self._get_file_hash(file_id)
-            created_at = datetime.now().isoformat()
-            expires_at = (datetime.now() + timedelta(days=self.ttl_days)).isoformat()
+            created_at = time.time()
+            expires_at = created_at + self.ttl_days * SECONDS_PER_DAY
             
             await self._metadata_db.execute("""
                 INSERT OR REPLACE INTO cache_metadata 
@@ -179,11 +428,13 @@ class DiskCacheService:
                 expires_at
             ))
             await self._metadata_db.commit()
+            self._remember_expiry(file_id, file_format, expires_at)
             
             # Update statistics
             self.stats['total_files'] += 1
             self.stats['total_size_bytes'] += len(content)
             self.stats['files_created'] += 1
+            self.stats['file_types'][file_format] += 1
             
             logger.debug(f"Stored file {file_id} in disk cache: {len(content)} bytes")
             return True
@@ -194,44 +445,62 @@ class DiskCacheService:
             logger.error(f"Error storing file {file_id} in disk cache: {e}")
             return False
     
+    async def _is_fresh(self, file_id: str, file_format: str, cache_path: Path) -> bool:
+        """Check whether a cache entry may be served, removing it if expired.
+        
+        Entries whose expiry is memoized in-process are trusted without a
+        metadata query. The file itself is not stat'ed: callers open it
+        directly and treat FileNotFoundError as a miss.
+        """
+        key = (file_id, file_format)
+        expires_at = self._expiry_cache.get(key)
+        if expires_at is not None and time.time() <= expires_at:
+            self._expiry_cache.move_to_end(key)
+            return True
+        
+        await self._ensure_db_connection()
+        
+        # Check metadata for expiration from database
+        async with self._metadata_db.execute("""
+            SELECT expires_at FROM cache_metadata 
+            WHERE file_id = ? AND file_format = ?
+        """, (file_id, file_format)) as cursor:
+            row = await cursor.fetchone()
+            
+        if row:
+            if time.time() > row[0]:
+                # File expired, remove it
+                await self.delete_file(file_id, file_format)
+                return False
+            self._remember_expiry(file_id, file_format, row[0])
+        else:
+            # No metadata in DB, file might be orphaned, check file age
+            try:
+                file_stat = cache_path.stat()
+            except FileNotFoundError:
+                return False
+            if time.time() - file_stat.st_mtime > self.ttl_days * SECONDS_PER_DAY:
+                await self.delete_file(file_id, file_format)
+                return False
+        return True
+    
     async def get_file(self, file_id: str, file_format: str) -> Optional[bytes]:
         """Retrieve file content from disk cache."""
         try:
-            await self._ensure_db_connection()
-            
             cache_path = self._get_cache_path(file_id, file_format)
             
-            if not cache_path.exists():
+            if not await self._is_fresh(file_id, file_format, cache_path):
                 self.stats['cache_misses'] += 1
                 return None
             
-            # Check metadata for expiration from database
-            async with self._metadata_db.execute("""
-                SELECT expires_at FROM cache_metadata 
-                WHERE file_id = ? AND file_format = ?
-            """, (file_id, file_format)) as cursor:
-                row = await cursor.fetchone()
-                
-            if row:
-                expires_at_str = row[0]
-                expires_at = datetime.fromisoformat(expires_at_str)
-                if datetime.now() > expires_at:
-                    # File expired, remove it
-                    await self.delete_file(file_id, file_format)
-                    self.stats['cache_misses'] += 1
-                    return None
-            else:
-                # No metadata in DB, file might be orphaned, check file age
-                file_stat = cache_path.stat()
-                file_age = datetime.now() - datetime.fromtimestamp(file_stat.st_mtime)
-                if file_age > timedelta(days=self.ttl_days):
-                    await self.delete_file(file_id, file_format)
-                    self.stats['cache_misses'] += 1
-                    return None
-            
-            # Read file content
-            async with aiofiles.open(cache_path, 'rb') as f:
-                content = await f.read()
+            # Read file content in a single thread hop (open + read + close)
+            try:
+                content = await self._run_io(_read_bytes, cache_path, self.fadvise_dontneed)
+            except FileNotFoundError:
+                # Removed by another worker's cleanup
+                self._forget_expiry(file_id, file_format)
+                self.stats['cache_misses'] += 1
+                return None
             
             self.stats['cache_hits'] += 1
             logger.debug(f"Retrieved file {file_id} from disk cache: {len(content)} bytes")
@@ -244,6 +513,72 @@ class DiskCacheService:
             self.stats['cache_misses'] += 1
             return None
     
+    async def get_file_view(self, file_id: str, file_format: str) -> Optional[memoryview]:
+        """Retrieve file content as a read-only memoryview over an mmap.
+        
+        Avoids allocating a bytes copy of large entries; the view is backed
+        by the page cache and can be written to sockets as-is.
+        """
+        try:
+            cache_path = self._get_cache_path(file_id, file_format)
+            
+            if not await self._is_fresh(file_id, file_format, cache_path):
+                self.stats['cache_misses'] += 1
+                return None
+            
+            try:
+                view = await self._run_io(_map_file, cache_path)
+            except FileNotFoundError:
+                self._forget_expiry(file_id, file_format)
+                self.stats['cache_misses'] += 1
+                return None
+            
+            self.stats['cache_hits'] += 1
+            logger.debug(f"Mapped file {file_id} from disk cache: {view.nbytes} bytes")
+            return view
+            
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+            self.stats['last_error_at'] = datetime.now().isoformat()
+            logger.error(f"Error mapping file {file_id} from disk cache: {e}")
+            self.stats['cache_misses'] += 1
+            return None
+    
+    async def sendfile_to(self, file_id: str, file_format: str, out_fd: int,
+                          offset: int = 0, count: Optional[int] = None) -> Optional[int]:
+        """Send a cached file straight to out_fd with os.sendfile.
+        
+        The bytes go from the page cache to the socket (or file) without
+        being copied into Python memory. out_fd must be in blocking mode.
+        
+        Returns:
+            Number of bytes sent, or None if the entry is not cached
+        """
+        try:
+            cache_path = self._get_cache_path(file_id, file_format)
+            
+            if not await self._is_fresh(file_id, file_format, cache_path):
+                self.stats['cache_misses'] += 1
+                return None
+            
+            try:
+                sent = await self._run_io(_sendfile, cache_path, out_fd, offset, count)
+            except FileNotFoundError:
+                self._forget_expiry(file_id, file_format)
+                self.stats['cache_misses'] += 1
+                return None
+            
+            self.stats['cache_hits'] += 1
+            logger.debug(f"Sent file {file_id} from disk cache: {sent} bytes")
+            return sent
+            
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+            self.stats['last_error_at'] = datetime.now().isoformat()
+            logger.error(f"Error sending file {file_id} from disk cache: {e}")
+            self.stats['cache_misses'] += 1
+            return None
+    
     async def delete_file(self, file_id: str, file_format: str) -> bool:
         """Delete file from disk cache."""
         try:
@@ -251,24 +586,29 @@ class DiskCacheService:
             
             cache_path = self._get_cache_path(file_id, file_format)
             
-            # Get file size before deletion
-            file_size = 0
-            if cache_path.exists():
-                file_size = cache_path.stat().st_size
+            try:
                 cache_path.unlink()
+                removed = True
+            except FileNotFoundError:
+                removed = False
             
-            # Remove metadata from database
-            await self._metadata_db.execute("""
+            # Remove metadata from database; the indexed size saves a stat()
+            async with self._metadata_db.execute("""
                 DELETE FROM cache_metadata 
                 WHERE file_id = ? AND file_format = ?
-            """, (file_id, file_format))
+                RETURNING size
+            """, (file_id, file_format)) as cursor:
+                row = await cursor.fetchone()
             await self._metadata_db.commit()
+            self._forget_expiry(file_id, file_format)
             
             # Update statistics
-            if file_size > 0:
+            if removed:
+                file_size = row[0] if row else 0
                 self.stats['total_files'] = max(0, self.stats['total_files'] - 1)
                 self.stats['total_size_bytes'] = max(0, self.stats['total_size_bytes'] - file_size)
                 self.stats['files_deleted'] += 1
+                self.stats['file_types'][file_format] = max(0, self.stats['file_types'][file_format] - 1)
             
             logger.debug(f"Deleted file {file_id} from disk cache")
             return True
@@ -279,13 +619,42 @@ class DiskCacheService:
             logger.error(f"Error deleting file {file_id} from disk cache: {e}")
             return False
     
+    async def _delete_entries(self, entries: List[Tuple[str, str]]) -> int:
+        """Delete a batch of (file_id, file_format) entries.
+        
+        Unlinks the files on up to UNLINK_WORKERS threads in parallel and
+        drops the rows in one transaction, instead of a delete_file()
+        round-trip per entry.
+        Callers resync total counters with rescan_stats() afterwards.
+        """
+        # Sorted paths keep each shard directory within one contiguous slice,
+        # so the parallel unlink workers do not contend on the same directory
+        paths = sorted(self._get_cache_path(file_id, file_format) for file_id, file_format in entries)
+        step = max(1, -(-len(paths) // UNLINK_WORKERS))
+        results = await asyncio.gather(*(
+            self._run_io(_unlink_files, paths[i:i + step])
+            for i in range(0, len(paths), step)
+        ))
+        files_removed = sum(results)
+        
+        await self._metadata_db.executemany("""
+            DELETE FROM cache_metadata 
+            WHERE file_id = ? AND file_format = ?
+        """, entries)
+        await self._metadata_db.commit()
+        for file_id, file_format in entries:
+            self._forget_expiry(file_id, file_format)
+        
+        self.stats['files_deleted'] += files_removed
+        return len(entries)
+    
     async def cleanup_expired_files(self, batch_size: int = 1000) -> int:
         """Remove expired files from disk cache using database index."""
         try:
             await self._ensure_db_connection()
             
             removed_count = 0
-            current_time = datetime.now().isoformat()
+            current_time = time.time()
             
             # Query expired files in batches
             while True:
@@ -299,18 +668,13 @@ class DiskCacheService:
                 if not expired_files:
                     break
                 
-                # Delete files in parallel batches
-                tasks = []
-                for file_id, file_format in expired_files:
-                    tasks.append(self.delete_file(file_id, file_format))
-                
-                if tasks:
-                    results = await asyncio.gather(*tasks, return_exceptions=True)
-                    batch_removed = sum(1 for r in results if r is True)
-                    removed_count += batch_removed
+                removed_count += await self._delete_entries(expired_files)
             
             self.stats['cleanup_runs'] += 1
-            self.stats['last_cleanup'] = current_time
+            self.stats['last_cleanup'] = datetime.fromtimestamp(current_time).isoformat()
+            
+            # Periodic cleanup is where counters are resynced with the index
+            await self.rescan_stats()
             
             if removed_count > 0:
                 logger.info(f"Cleaned up {removed_count} expired files from disk cache")
@@ -323,7 +687,7 @@ class DiskCacheService:
             logger.error(f"Error during disk cache cleanup: {e}")
             return 0
     
-    async def cleanup_oldest_files(self, target_size_mb: int, max_workers: int = 10) -> int:
+    async def cleanup_oldest_files(self, target_size_mb: int) -> int:
         """Remove oldest files to reduce cache size to target using database."""
         try:
             await self._ensure_db_connection()
@@ -360,16 +724,8 @@ class DiskCacheService:
             if not files_to_delete:
                 return 0
             
-            # Process deletions in parallel batches with semaphore
-            semaphore = asyncio.Semaphore(max_workers)
-            
-            async def delete_with_limit(file_id, file_format):
-                async with semaphore:
-                    return await self.delete_file(file_id, file_format)
-            
-            tasks = [delete_with_limit(fid, fmt) for fid, fmt in files_to_delete]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            removed_count = sum(1 for r in results if r is True)
+            removed_count = await self._delete_entries(files_to_delete)
+            await self.rescan_stats()
             
             if removed_count > 0:
                 logger.info(f"Removed {removed_count} oldest files to reduce cache size")
@@ -425,6 +781,25 @@ class DiskCacheService:
             "metadata_db_writable": db_writable,
         }
 
+    @staticmethod
+    def _iter_cache_files(root: Path):
+        """Yield os.DirEntry for every regular file under root.
+
+        Single-pass, stack-based os.scandir walk: no Path objects are built per
+        file and file/dir checks use the d_type returned by the directory read.
+        """
+        stack = [str(root)]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
     def _fs_scan_counts(self, scan_limit: int = 5000) -> Dict[str, Any]:
         """Best-effort filesystem scan to estimate how many cached files exist on disk.
 
@@ -438,27 +813,22 @@ class DiskCacheService:
 
         try:
             for fmt in formats:
-                fmt_dir = self.cache_dir / fmt
-                if not fmt_dir.exists() or not fmt_dir.is_dir():
-                    continue
-                for root, _dirs, files in os.walk(fmt_dir):
-                    for name in files:
-                        if scanned_files >= scan_limit:
-                            truncated = True
-                            break
-                        # We expect files like "<md5>.<fmt>"
-                        if not name.endswith(f".{fmt}"):
-                            continue
-                        p = Path(root) / name
-                        try:
-                            counts_by_format[fmt] += 1
-                            bytes_by_format[fmt] += p.stat().st_size
-                            scanned_files += 1
-                        except OSError:
-                            # Ignore disappearing/inaccessible files
-                            continue
-                    if truncated:
+                # We expect files like "<md5>.<fmt>"
+                suffix = f".{fmt}"
+                for entry in self._iter_cache_files(self.cache_dir / fmt):
+                    if scanned_files >= scan_limit:
+                        truncated = True
                         break
+                    if not entry.name.endswith(suffix):
+                        continue
+                    try:
+                        size = entry.stat().st_size
+                    except OSError:
+                        # Ignore disappearing/inaccessible files
+                        continue
+                    counts_by_format[fmt] += 1
+                    bytes_by_format[fmt] += size
+                    scanned_files += 1
                 if truncated:
                     break
         except Exception:
@@ -518,40 +888,40 @@ class DiskCacheService:
         }
 
         if include_fs:
-            diagnostics["fs_scan"] = self._fs_scan_counts(scan_limit=fs_scan_limit)
+            diagnostics["fs_scan"] = await asyncio.to_thread(self._fs_scan_counts, fs_scan_limit)
 
         return diagnostics
     
+    async def rescan_stats(self) -> None:
+        """Recompute file counters from the metadata index.
+        
+        Counters are otherwise maintained incrementally by store/delete; this
+        resyncs them with rows written or removed by other workers.
+        """
+        await self._ensure_db_connection()
+        
+        async with self._metadata_db.execute("""
+            SELECT file_format, COUNT(*), COALESCE(SUM(size), 0)
+            FROM cache_metadata
+            GROUP BY file_format
+        """) as cursor:
+            rows = await cursor.fetchall()
+        
+        self.stats['total_files'] = sum(count for _fmt, count, _size in rows)
+        self.stats['total_size_bytes'] = sum(size for _fmt, _count, size in rows)
+        self.stats['file_types'] = defaultdict(int, {fmt: count for fmt, count, _size in rows})
+        self._stats_rescanned_at = time.monotonic()
+    
     async def get_cache_stats(self) -> Dict[str, Any]:
-        """Get disk cache statistics from database."""
+        """Get disk cache statistics (rescans the index at most every STATS_RESCAN_INTERVAL_SECONDS)."""
         try:
-            await self._ensure_db_connection()
+            if (self._stats_rescanned_at is None
+                    or time.monotonic() - self._stats_rescanned_at > STATS_RESCAN_INTERVAL_SECONDS):
+                await self.rescan_stats()
             
-            # Fast query from database using SQL aggregations
-            async with self._metadata_db.execute("""
-                SELECT 
-                    COUNT(*) as total_files,
-                    COALESCE(SUM(size), 0) as total_size_bytes,
-                    file_format,
-                    COUNT(*) as format_count
-                FROM cache_metadata
-                GROUP BY file_format
-            """) as cursor:
-                rows = await cursor.fetchall()
-            
-            total_files = 0
-            total_size_bytes = 0
-            file_types = {}
-            
-            for row in rows:
-                count, size, file_format, format_count = row
-                total_files += count
-                total_size_bytes += size or 0
-                file_types[file_format] = format_count
-            
-            # Update in-memory stats
-            self.stats['total_files'] = total_files
-            self.stats['total_size_bytes'] = total_size_bytes
+            total_files = self.stats['total_files']
+            total_size_bytes = self.stats['total_size_bytes']
+            file_types = {fmt: count for fmt, count in self.stats['file_types'].items() if count > 0}
             
             # Calculate additional stats
             cache_hit_rate = 0
@@ -603,22 +973,26 @@ class DiskCacheService:
         try:
             await self._ensure_db_connection()
             
-            # Get all files from database
-            async with self._metadata_db.execute("""
-                SELECT file_id, file_format FROM cache_metadata
-            """) as cursor:
-                all_files = await cursor.fetchall()
-            
-            removed_count = 0
-            
-            # Delete all files
-            for file_id, file_format in all_files:
-                if await self.delete_file(file_id, file_format):
-                    removed_count += 1
+            async with self._metadata_db.execute("SELECT COUNT(*) FROM cache_metadata") as cursor:
+                row = await cursor.fetchone()
+                removed_count = row[0] if row else 0
+            async with self._metadata_db.execute("SELECT DISTINCT file_format FROM cache_metadata") as cursor:
+                format_dirs = [row[0] for row in await cursor.fetchall()]
+            
+            # Detach the format directories with a few renames and delete them
+            # in the background, instead of unlinking every file before returning
+            trash_dir = self.cache_dir / f"{TRASH_DIR_PREFIX}{uuid.uuid4().hex}"
+            await asyncio.to_thread(_detach_cache_dirs, self.cache_dir, trash_dir, format_dirs)
+            trash_task = asyncio.create_task(
+                asyncio.to_thread(shutil.rmtree, trash_dir, ignore_errors=True)
+            )
+            self._trash_tasks.add(trash_task)
+            trash_task.add_done_callback(self._trash_tasks.discard)
             
             # Clear database
             await self._metadata_db.execute("DELETE FROM cache_metadata")
             await self._metadata_db.commit()
+            self._expiry_cache.clear()
             
             # Reset statistics
             self.stats = {
@@ -630,7 +1004,11 @@ class DiskCacheService:
                 'files_deleted': 0,
                 'cleanup_runs': 0,
                 'last_cleanup': None,
+                'last_error': None,
+                'last_error_at': None,
+                'file_types': defaultdict(int),
             }
+            self._stats_rescanned_at = time.monotonic()
             
             logger.info(f"Cleared disk cache: removed {removed_count} files")
             return removed_count
@@ -1,18 +1,328 @@
 import os
 import asyncio
-import aiofiles
-import json
+import orjson
 import time
 import shutil
 import logging
 import hashlib
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, Tuple
+import heapq
+import functools
+import uuid
+import struct
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+SUPPORTED_FORMATS = ('tgs', 'lottie', 'webp', 'webm', 'png', 'jpg')
+
+MIME_TYPES = {
+    'tgs': 'application/gzip',
+    'lottie': 'application/json',
+    'webp': 'image/webp',
+    'webm': 'video/webm',
+    'png': 'image/png',
+    'jpg': 'image/jpeg'
+}
+
+# In-process payload cache in front of the disk: total budget and the largest
+# payload kept (bigger entries are always served from disk)
+MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+MEMORY_CACHE_MAX_ITEM_BYTES = 100 * 1024
+
+# Number of cache hits between flushes of updated last_accessed times to disk
+ACCESS_FLUSH_EVERY = 256
+
+
+@dataclass(slots=True)
+class MetaEntry:
+    """In-memory copy of an entry's metadata (timestamps as epoch seconds)."""
+    expires_at: float
+    file_size: int
+    last_accessed: float
+    mime_type: str
+
+
+@functools.lru_cache(maxsize=4096)
+def _file_id_hash(file_id: str) -> str:
+    # The MD5 hex digest is the on-disk name of every entry, so it is kept
+    # (switching algorithms would orphan the existing cache) and memoized.
+    return hashlib.md5(file_id.encode()).hexdigest()
+
+
+def _to_epoch(value: Any, default: float) -> float:
+    """Convert a stored timestamp (ISO string or epoch number) to epoch seconds."""
+    if not value:
+        return default
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+def _entry_from_meta(meta: Dict[str, Any], ttl_seconds: float) -> MetaEntry:
+    now = time.time()
+    return MetaEntry(
+        expires_at=_to_epoch(meta.get('expires_at'), now + ttl_seconds),
+        file_size=meta.get('file_size', 0),
+        last_accessed=_to_epoch(meta.get('last_accessed'), now),
+        mime_type=meta.get('mime_type', 'application/octet-stream'),
+    )
+
+
+# Entry files start with a fixed header and a small JSON block (file_id,
+# output_format, mime_type) followed by the payload, so one file carries
+# both. Files without the magic were written with a .meta sidecar.
+ENTRY_MAGIC = b"SPC1"
+# magic, created_at, expires_at, last_accessed, file_size, info length
+ENTRY_HEADER = struct.Struct('<4sdddQI')
+LAST_ACCESSED = struct.Struct('<d')
+LAST_ACCESSED_OFFSET = 20
+
+# Suffix of in-progress writes; renamed into place once complete
+TMP_SUFFIX = ".tmp"
+
+
+def _read_meta_sync(path: Path) -> Dict[str, Any]:
+    """Read and parse a legacy .meta sidecar in one thread hop."""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def _pack_header(meta: Dict[str, Any]) -> bytes:
+    info = orjson.dumps({
+        'file_id': meta['file_id'],
+        'output_format': meta['output_format'],
+        'mime_type': meta['mime_type'],
+    })
+    return ENTRY_HEADER.pack(
+        ENTRY_MAGIC, meta['created_at'], meta['expires_at'], meta['last_accessed'],
+        meta['file_size'], len(info)
+    ) + info
+
+
+def _parse_header(f) -> Optional[Dict[str, Any]]:
+    """Read an entry header from an open file; None if the file has none."""
+    head = f.read(ENTRY_HEADER.size)
+    if len(head) < ENTRY_HEADER.size or head[:4] != ENTRY_MAGIC:
+        return None
+    _, created_at, expires_at, last_accessed, file_size, info_len = ENTRY_HEADER.unpack(head)
+    meta = orjson.loads(f.read(info_len))
+    meta.update(
+        created_at=created_at,
+        expires_at=expires_at,
+        last_accessed=last_accessed,
+        file_size=file_size,
+    )
+    return meta
+
+
+def _read_header_sync(path: Path) -> Optional[Dict[str, Any]]:
+    with open(path, 'rb') as f:
+        return _parse_header(f)
+
+
+def _read_entry_sync(path: Path) -> bytes:
+    """Read an entry's payload, skipping its header if it has one.
+    
+    The whole file (header included) is fetched with a single read() sized
+    from fstat, rather than separate buffered reads for header and payload.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        data = os.read(fd, size)
+        while len(data) < size:
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        os.close(fd)
+    if len(data) < ENTRY_HEADER.size or data[:4] != ENTRY_MAGIC:
+        return data
+    info_len = ENTRY_HEADER.unpack_from(data)[-1]
+    return data[ENTRY_HEADER.size + info_len:]
+
+
+def _move_flat_entry_sync(file_path: Path, meta_path: Path) -> None:
+    """Move an entry written before sharding (format/<hash>.<format>) into its shard.
+    
+    A .meta sidecar next to the flat file is moved along with it. Missing
+    files are ignored: another worker may have moved the entry already.
+    """
+    flat_dir = file_path.parent.parent
+    file_path.parent.mkdir(exist_ok=True)
+    for path in (file_path, meta_path):
+        try:
+            os.replace(flat_dir / path.name, path)
+        except FileNotFoundError:
+            continue
+
+
+def _read_entry_meta_sync(file_path: Path, meta_path: Path) -> Dict[str, Any]:
+    """Read an entry's metadata from its header, or its .meta sidecar if it has none.
+    
+    Entries still in the flat pre-sharding layout are moved into their
+    shard first. Raises FileNotFoundError if the entry does not exist.
+    """
+    try:
+        meta = _read_header_sync(file_path)
+    except FileNotFoundError:
+        _move_flat_entry_sync(file_path, meta_path)
+        meta = _read_header_sync(file_path)
+    if meta is None:
+        meta = _read_meta_sync(meta_path)
+    return meta
+
+
+def _read_sharded_entry_sync(file_path: Path, meta_path: Path) -> bytes:
+    """_read_entry_sync, moving a flat pre-sharding entry into its shard on a miss."""
+    try:
+        return _read_entry_sync(file_path)
+    except FileNotFoundError:
+        _move_flat_entry_sync(file_path, meta_path)
+        return _read_entry_sync(file_path)
+
+
+def _update_access_times_sync(updates) -> int:
+    """Overwrite last_accessed in the header of each (file_path, epoch) pair."""
+    updated = 0
+    for file_path, last_accessed in updates:
+        try:
+            with open(file_path, 'r+b') as f:
+                if f.read(len(ENTRY_MAGIC)) != ENTRY_MAGIC:
+                    continue
+                f.seek(LAST_ACCESSED_OFFSET)
+                f.write(LAST_ACCESSED.pack(last_accessed))
+            updated += 1
+        except FileNotFoundError:
+            continue
+    return updated
+
+
+def _iter_format_files(format_dir: Path):
+    """Yield os.DirEntry objects for the files of a format directory and its shards.
+    
+    Uses os.scandir so type checks and stat() come from the directory
+    listing where the platform provides them, without a syscall per file.
+    Files sitting directly in format_dir predate sharding and are still
+    listed so cleanup can expire them. A shard removed while the scan runs
+    (e.g. by clear_cache) is skipped.
+    """
+    with os.scandir(format_dir) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    shard = os.scandir(entry.path)
+                except FileNotFoundError:
+                    continue
+                with shard:
+                    for shard_entry in shard:
+                        if not shard_entry.name.endswith(TMP_SUFFIX):
+                            yield shard_entry
+            elif not entry.name.endswith(TMP_SUFFIX):
+                yield entry
+
+
+def _replace_into(file_path: Path, write) -> None:
+    """Create file_path atomically: write(fd) fills a temp file that is renamed over it.
+    
+    Deliberately no fsync: losing recent entries on a crash is acceptable
+    for a cache, while readers must never see a partially written file.
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex}{TMP_SUFFIX}")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        try:
+            write(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _write_all(fd: int, data) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _copy_entry_sync(file_path: Path, src_path: Path, meta: Dict[str, Any]) -> None:
+    """Write an entry whose payload is copied from src_path with os.sendfile.
+    
+    The payload goes file-to-file inside the kernel; meta['file_size'] is
+    filled in from the source before the header is written.
+    """
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        size = os.fstat(src_fd).st_size
+        meta['file_size'] = size
+        header = _pack_header(meta)
+        
+        def write(dst_fd: int) -> None:
+            _write_all(dst_fd, header)
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        
+        _replace_into(file_path, write)
+    finally:
+        os.close(src_fd)
+
+
+def _unlink_entries_sync(path_groups: List[List[Path]]) -> int:
+    """Unlink the files of many entries in one thread hop.
+    
+    Returns the number of groups (entries) that had at least one file.
+    """
+    removed = 0
+    for paths in path_groups:
+        found = False
+        for path in paths:
+            try:
+                path.unlink()
+                found = True
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error(f"Error deleting file {path} from disk cache: {e}")
+        if found:
+            removed += 1
+    return removed
+
+
+def _clear_format_dir_sync(format_dir: Path) -> int:
+    """Remove a format directory tree and recreate it empty; returns files removed."""
+    count = sum(1 for path in _iter_format_files(format_dir) if path.is_file())
+    shutil.rmtree(format_dir, ignore_errors=True)
+    format_dir.mkdir(exist_ok=True)
+    return count
+
+
+def _write_entry_sync(file_path: Path, content: bytes, meta: Dict[str, Any]) -> None:
+    """Write an entry (header + payload) in one thread hop."""
+    header = _pack_header(meta)
+    
+    def write(fd: int) -> None:
+        _write_all(fd, header)
+        _write_all(fd, content)
+    
+    _replace_into(file_path, write)
+
+
 class DiskCacheService:
     """Enhanced disk cache service with format-specific directories."""
     
@@ -22,6 +332,7 @@ class DiskCacheService:
         self.ttl_days = settings.disk_cache_ttl_days
         self.cleanup_interval_hours = settings.disk_cache_cleanup_interval_hours
         self.enabled = settings.disk_cache_enabled
+        self._format_dirs = {fmt: self.cache_dir / fmt for fmt in SUPPORTED_FORMATS}
         
         self.stats = {
             'cache_hits': 0,
@@ -32,6 +343,28 @@ class DiskCacheService:
             'last_cleanup': None,
         }
         
+        # (file_id, output_format) -> MetaEntry, loaded by one directory scan on
+        # first use; entries written by other workers are picked up on demand
+        self._index: Dict[Tuple[str, str], MetaEntry] = {}
+        self._index_loaded = False
+        self._index_lock = asyncio.Lock()
+        # Keys whose last_accessed changed since the last flush to disk
+        self._accessed: set = set()
+        # Min-heap of (last_accessed, file_id, output_format) for LRU eviction;
+        # pushes are lazy, so tuples whose time no longer matches the index are stale
+        self._lru_heap: List[Tuple[float, str, str]] = []
+        # Min-heap of (expires_at, file_id, output_format) for expiry sweeps, same
+        # lazy-deletion scheme as the LRU heap
+        self._ttl_heap: List[Tuple[float, str, str]] = []
+        # (file_id, output_format) -> payload for small hot entries, LRU-ordered
+        self._mem: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        
+        # Running cleanup per (kind, argument): concurrent callers join it instead
+        # of starting another scan; the lock keeps different cleanups apart
+        self._cleanup_tasks: Dict[Tuple[str, Any], asyncio.Task] = {}
+        self._cleanup_lock = asyncio.Lock()
+        
         if self.enabled:
             self.cache_dir.mkdir(parents=True, exist_ok=True)
             # Create format-specific directories
@@ -40,64 +373,176 @@ class DiskCacheService:
             logger.info(f"Max cache size: {self.max_cache_size_mb} MB")
             logger.info(f"TTL: {self.ttl_days} days")
             logger.info("Format-specific directories created")
+            logger.info("Entries are written without fsync; mount the cache with noatime for best performance")
         else:
             logger.info("Disk cache is DISABLED")
     
     def _create_format_directories(self):
         """Create directories for each supported format."""
-        formats = ['tgs', 'lottie', 'webp', 'webm', 'png', 'jpg']
-        for format_name in formats:
-            format_dir = self.cache_dir / format_name
+        for format_dir in self._format_dirs.values():
             format_dir.mkdir(exist_ok=True)
             logger.debug(f"Created directory: {format_dir}")
     
     def _get_file_hash(self, file_id: str) -> str:
         """Generate a hash for the file ID to use as filename."""
-        return hashlib.md5(file_id.encode()).hexdigest()
+        return _file_id_hash(file_id)
+    
+    def _format_dir(self, output_format: str) -> Path:
+        format_dir = self._format_dirs.get(output_format)
+        if format_dir is None:
+            format_dir = self._format_dirs[output_format] = self.cache_dir / output_format
+        return format_dir
     
     def _get_file_path(self, file_id: str, output_format: str) -> Path:
-        """Get file path with format-specific directory structure."""
+        """Get file path with format-specific directory structure.
+        
+        Files are sharded by the first two hex chars of the hash
+        (format/ab/abcd....format) to keep directories small.
+        """
         file_hash = self._get_file_hash(file_id)
-        format_dir = self.cache_dir / output_format
-        return format_dir / f"{file_hash}.{output_format}"
+        return self._format_dir(output_format) / file_hash[:2] / f"{file_hash}.{output_format}"
     
     def _get_metadata_path(self, file_id: str, output_format: str) -> Path:
         """Get metadata path with format-specific directory structure."""
         file_hash = self._get_file_hash(file_id)
-        format_dir = self.cache_dir / output_format
-        return format_dir / f"{file_hash}.{output_format}.meta"
+        return self._format_dir(output_format) / file_hash[:2] / f"{file_hash}.{output_format}.meta"
+    
+    def _scan_metadata(self) -> List[Dict[str, Any]]:
+        """Read the metadata of every entry (run via asyncio.to_thread)."""
+        metas = []
+        for format_dir in self.cache_dir.iterdir():
+            if not format_dir.is_dir():
+                continue
+            for file_path in _iter_format_files(format_dir):
+                try:
+                    if file_path.name.endswith('.meta'):
+                        metas.append(_read_meta_sync(file_path))
+                    else:
+                        meta = _read_header_sync(file_path)
+                        # Headerless payloads are described by their .meta sidecar
+                        if meta is not None:
+                            metas.append(meta)
+                except Exception as e:
+                    logger.error(f"Error reading metadata of {file_path.path}: {e}")
+        return metas
+    
+    def _scan_index(self) -> Dict[Tuple[str, str], MetaEntry]:
+        """Build the metadata index from a full scan (run via asyncio.to_thread)."""
+        ttl_seconds = self.ttl_days * 86400
+        return {
+            (meta.get('file_id', ''), meta.get('output_format', '')): _entry_from_meta(meta, ttl_seconds)
+            for meta in self._scan_metadata()
+        }
+    
+    async def _ensure_index(self) -> None:
+        """Load the metadata index on first use."""
+        if self._index_loaded:
+            return
+        async with self._index_lock:
+            if self._index_loaded:
+                return
+            index = await asyncio.to_thread(self._scan_index)
+            # Keep entries set while the scan was running
+            index.update(self._index)
+            self._index = index
+            self._rebuild_lru_heap()
+            self._ttl_heap = [
+                (entry.expires_at, file_id, output_format)
+                for (file_id, output_format), entry in self._index.items()
+            ]
+            heapq.heapify(self._ttl_heap)
+            self._index_loaded = True
+            logger.info(f"Disk cache index loaded: {len(index)} entries")
+    
+    def _rebuild_lru_heap(self) -> None:
+        self._lru_heap = [
+            (entry.last_accessed, file_id, output_format)
+            for (file_id, output_format), entry in self._index.items()
+        ]
+        heapq.heapify(self._lru_heap)
+    
+    def _push_lru(self, file_id: str, output_format: str, last_accessed: float) -> None:
+        heapq.heappush(self._lru_heap, (last_accessed, file_id, output_format))
+        # Compact once stale tuples outnumber live entries
+        if len(self._lru_heap) > 2 * len(self._index) + 1024:
+            self._rebuild_lru_heap()
+    
+    async def _lookup_entry(self, file_id: str, output_format: str) -> Optional[MetaEntry]:
+        """Get an entry from the index, falling back to the file's header."""
+        key = (file_id, output_format)
+        entry = self._index.get(key)
+        if entry is None:
+            # Not seen by this process yet (e.g. written by another worker)
+            try:
+                meta = await asyncio.to_thread(
+                    _read_entry_meta_sync,
+                    self._get_file_path(file_id, output_format),
+                    self._get_metadata_path(file_id, output_format)
+                )
+            except FileNotFoundError:
+                return None
+            entry = _entry_from_meta(meta, self.ttl_days * 86400)
+            self._index[key] = entry
+            self._push_lru(file_id, output_format, entry.last_accessed)
+            heapq.heappush(self._ttl_heap, (entry.expires_at, file_id, output_format))
+        return entry
+    
+    async def flush_access_times(self) -> int:
+        """Persist in-memory last_accessed updates to the entry headers."""
+        if not self._accessed:
+            return 0
+        keys, self._accessed = self._accessed, set()
+        updates = [
+            (self._get_file_path(file_id, output_format), self._index[(file_id, output_format)].last_accessed)
+            for file_id, output_format in keys
+            if (file_id, output_format) in self._index
+        ]
+        return await asyncio.to_thread(_update_access_times_sync, updates)
     
     async def get_file(self, file_id: str, output_format: str) -> Optional[bytes]:
         """Get file from disk cache with format-specific lookup."""
         if not self.enabled:
             return None
         
-        file_path = self._get_file_path(file_id, output_format)
-        meta_path = self._get_metadata_path(file_id, output_format)
-        
-        if not file_path.exists() or not meta_path.exists():
-            self.stats['cache_misses'] += 1
-            logger.debug(f"Disk cache miss: {file_id}.{output_format}")
-            return None
-        
         try:
-            async with aiofiles.open(meta_path, 'r') as f:
-                meta = json.loads(await f.read())
+            await self._ensure_index()
             
-            expires_at_str = meta.get('expires_at', '')
-            if expires_at_str:
-                expires_at = datetime.fromisoformat(expires_at_str)
-            else:
-                expires_at = datetime.now() + timedelta(days=self.ttl_days)
+            entry = await self._lookup_entry(file_id, output_format)
+            if entry is None:
+                self.stats['cache_misses'] += 1
+                logger.debug(f"Disk cache miss: {file_id}.{output_format}")
+                return None
             
-            if datetime.now() > expires_at:
+            now = time.time()
+            if now > entry.expires_at:
                 logger.info(f"Disk cache: {file_id}.{output_format} expired. Deleting.")
                 await self.delete_file(file_id, output_format)
                 self.stats['cache_misses'] += 1
                 return None
             
-            async with aiofiles.open(file_path, 'rb') as f:
-                content = await f.read()
+            key = (file_id, output_format)
+            content = self._mem.get(key)
+            if content is not None:
+                self._mem.move_to_end(key)
+            else:
+                try:
+                    content = await asyncio.to_thread(
+                        _read_sharded_entry_sync,
+                        self._get_file_path(file_id, output_format),
+                        self._get_metadata_path(file_id, output_format)
+                    )
+                except FileNotFoundError:
+                    self._index.pop(key, None)
+                    self.stats['cache_misses'] += 1
+                    logger.debug(f"Disk cache miss: {file_id}.{output_format}")
+                    return None
+                self._mem_put(key, content)
+            
+            entry.last_accessed = now
+            self._push_lru(file_id, output_format, now)
+            self._accessed.add((file_id, output_format))
+            if len(self._accessed) >= ACCESS_FLUSH_EVERY:
+                await self.flush_access_times()
             
             self.stats['cache_hits'] += 1
             logger.debug(f"Disk cache hit: {file_id}.{output_format}")
@@ -107,61 +552,119 @@ class DiskCacheService:
             self.stats['cache_misses'] += 1
             return None
     
+    def _mem_put(self, key: Tuple[str, str], content: bytes) -> None:
+        """Keep a small payload in memory, evicting least recently used ones."""
+        if len(content) > MEMORY_CACHE_MAX_ITEM_BYTES:
+            return
+        self._mem_drop(key)
+        self._mem[key] = content
+        self._mem_bytes += len(content)
+        while self._mem_bytes > MEMORY_CACHE_MAX_BYTES:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+    
+    def _mem_drop(self, key: Tuple[str, str]) -> None:
+        content = self._mem.pop(key, None)
+        if content is not None:
+            self._mem_bytes -= len(content)
+    
+    def _new_meta(self, file_id: str, output_format: str, mime_type: str, file_size: int) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            'file_id': file_id,
+            'output_format': output_format,
+            'mime_type': mime_type,
+            'file_size': file_size,
+            'created_at': now,
+            'expires_at': now + self.ttl_days * 86400,
+            'last_accessed': now
+        }
+    
+    def _register_entry(self, meta: Dict[str, Any]) -> None:
+        """Add a freshly written entry to the index and the LRU/expiry heaps."""
+        file_id, output_format = meta['file_id'], meta['output_format']
+        self._index[(file_id, output_format)] = MetaEntry(
+            expires_at=meta['expires_at'],
+            file_size=meta['file_size'],
+            last_accessed=meta['last_accessed'],
+            mime_type=meta['mime_type'],
+        )
+        self._push_lru(file_id, output_format, meta['last_accessed'])
+        heapq.heappush(self._ttl_heap, (meta['expires_at'], file_id, output_format))
+        self.stats['files_created'] += 1
+    
     async def set_file(self, file_id: str, output_format: str, content: bytes, mime_type: str) -> bool:
         """Store file in disk cache with format-specific directory."""
         if not self.enabled:
             return False
         
         file_path = self._get_file_path(file_id, output_format)
-        meta_path = self._get_metadata_path(file_id, output_format)
         
         try:
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(content)
-            
-            expires_at = datetime.now() + timedelta(days=self.ttl_days)
-            meta = {
-                'file_id': file_id,
-                'output_format': output_format,
-                'mime_type': mime_type,
-                'file_size': len(content),
-                'created_at': datetime.now().isoformat(),
-                'expires_at': expires_at.isoformat(),
-                'last_accessed': datetime.now().isoformat()
-            }
-            async with aiofiles.open(meta_path, 'w') as f:
-                await f.write(json.dumps(meta))
+            meta = self._new_meta(file_id, output_format, mime_type, len(content))
+            await asyncio.to_thread(_write_entry_sync, file_path, content, meta)
+            self._register_entry(meta)
+            self._mem_put((file_id, output_format), content)
             
-            self.stats['files_created'] += 1
             logger.debug(f"Stored in disk cache: {file_id}.{output_format} ({len(content)} bytes)")
             return True
         except Exception as e:
             logger.error(f"Error writing to disk cache for {file_id}.{output_format}: {e}")
             return False
     
-    async def delete_file(self, file_id: str, output_format: str) -> bool:
-        """Delete file from disk cache."""
+    async def set_file_from_path(self, file_id: str, output_format: str,
+                                 src_path: Path, mime_type: str) -> bool:
+        """Store a file that is already on disk without reading it into memory.
+        
+        The payload is copied with os.sendfile, so callers holding e.g. a
+        converter's temp output can cache it without a bytes round-trip.
+        """
         if not self.enabled:
             return False
         
         file_path = self._get_file_path(file_id, output_format)
-        meta_path = self._get_metadata_path(file_id, output_format)
         
-        deleted_count = 0
-        for path in [file_path, meta_path]:
-            if path.exists():
-                try:
-                    path.unlink()
-                    deleted_count += 1
-                except OSError as e:
-                    logger.error(f"Error deleting file {path} from disk cache: {e}")
+        try:
+            meta = self._new_meta(file_id, output_format, mime_type, 0)
+            await asyncio.to_thread(_copy_entry_sync, file_path, Path(src_path), meta)
+            self._register_entry(meta)
+            self._mem_drop((file_id, output_format))
+            
+            logger.debug(f"Stored in disk cache: {file_id}.{output_format} ({meta['file_size']} bytes)")
+            return True
+        except Exception as e:
+            logger.error(f"Error writing to disk cache for {file_id}.{output_format}: {e}")
+            return False
+    
+    async def delete_file(self, file_id: str, output_format: str) -> bool:
+        """Delete file from disk cache."""
+        if not self.enabled:
+            return False
         
-        if deleted_count > 0:
-            self.stats['files_deleted'] += 1
+        if await self._delete_entries([(file_id, output_format)]) > 0:
             logger.debug(f"Deleted from disk cache: {file_id}.{output_format}")
             return True
         return False
     
+    def _entry_paths(self, file_id: str, output_format: str) -> List[Path]:
+        """All paths an entry's files may live at."""
+        file_path = self._get_file_path(file_id, output_format)
+        meta_path = self._get_metadata_path(file_id, output_format)
+        # Entries written before sharding live directly in the format directory
+        format_dir = self._format_dir(output_format)
+        return [file_path, meta_path, format_dir / file_path.name, format_dir / meta_path.name]
+    
+    async def _delete_entries(self, entries: List[Tuple[str, str]]) -> int:
+        """Delete a batch of (file_id, output_format) entries in one thread hop."""
+        for key in entries:
+            self._index.pop(key, None)
+            self._accessed.discard(key)
+            self._mem_drop(key)
+        path_groups = [self._entry_paths(file_id, output_format) for file_id, output_format in entries]
+        removed = await asyncio.to_thread(_unlink_entries_sync, path_groups)
+        self.stats['files_deleted'] += removed
+        return removed
+    
     async def get_cache_stats(self) -> Dict[str, Any]:
         """Get comprehensive cache statistics with format breakdown."""
         if not self.enabled:
@@ -186,8 +689,8 @@ class DiskCacheService:
             format_files = 0
             format_size = 0
             
-            for file_path in format_dir.iterdir():
-                if file_path.is_file() and not file_path.name.endswith('.meta'):
+            for file_path in _iter_format_files(format_dir):
+                if file_path.is_file(follow_symlinks=False) and not file_path.name.endswith('.meta'):
                     try:
                         format_files += 1
                         format_size += file_path.stat().st_size
@@ -219,101 +722,105 @@ class DiskCacheService:
         
         return current_stats
     
-    async def cleanup_expired_files(self) -> int:
-        """Clean up expired files from all format directories."""
+    async def _single_flight(self, key: Tuple[str, Any], factory) -> int:
+        """Run a cleanup once for all concurrent callers with the same key."""
+        task = self._cleanup_tasks.get(key)
+        if task is None or task.done():
+            async def run():
+                async with self._cleanup_lock:
+                    return await factory()
+            task = asyncio.create_task(run())
+            self._cleanup_tasks[key] = task
+            task.add_done_callback(
+                lambda t: self._cleanup_tasks.pop(key, None) if self._cleanup_tasks.get(key) is t else None
+            )
+        # Shielded so a cancelled caller does not cancel the shared cleanup
+        return await asyncio.shield(task)
+    
+    async def cleanup_expired_files(self, full_scan: bool = False) -> int:
+        """Clean up expired files from all format directories.
+        
+        By default expired entries are popped off the in-memory expiry heap,
+        which costs nothing when nothing has expired. full_scan reads every
+        entry's metadata instead, also catching entries this process has not
+        indexed (e.g. written by other workers since the index was loaded).
+        Concurrent calls share one run.
+        """
         if not self.enabled:
             return 0
         
-        removed_count = 0
-        current_time = datetime.now()
+        return await self._single_flight(
+            ('expired', full_scan), lambda: self._cleanup_expired_files(full_scan)
+        )
+    
+    async def _cleanup_expired_files(self, full_scan: bool) -> int:
+        expired = []
+        current_time = time.time()
+        ttl_seconds = self.ttl_days * 86400
         
-        for format_dir in self.cache_dir.iterdir():
-            if not format_dir.is_dir():
-                continue
-            
-            for file_path in format_dir.iterdir():
-                if file_path.name.endswith('.meta'):
-                    try:
-                        async with aiofiles.open(file_path, 'r') as f:
-                            metadata = json.loads(await f.read())
-                        
-                        expires_at_str = metadata.get('expires_at', '')
-                        if expires_at_str:
-                            expires_at = datetime.fromisoformat(expires_at_str)
-                        else:
-                            expires_at = current_time + timedelta(days=self.ttl_days)
-                        
-                        file_id = metadata.get('file_id', '')
-                        file_format = metadata.get('output_format', '')
-                        
-                        if current_time > expires_at:
-                            # File expired, remove it
-                            if await self.delete_file(file_id, file_format):
-                                removed_count += 1
-                                
-                    except Exception as e:
-                        logger.error(f"Error processing metadata file {file_path}: {e}")
-                        continue
+        if full_scan:
+            for metadata in await asyncio.to_thread(self._scan_metadata):
+                expires_at = _to_epoch(metadata.get('expires_at'), current_time + ttl_seconds)
+                
+                file_id = metadata.get('file_id', '')
+                file_format = metadata.get('output_format', '')
+                
+                if current_time > expires_at:
+                    expired.append((file_id, file_format))
+        else:
+            await self._ensure_index()
+            while self._ttl_heap and self._ttl_heap[0][0] < current_time:
+                expires_at, file_id, file_format = heapq.heappop(self._ttl_heap)
+                entry = self._index.get((file_id, file_format))
+                if entry is not None and entry.expires_at == expires_at:
+                    expired.append((file_id, file_format))
+        
+        # Remove all expired entries in one batch
+        removed_count = await self._delete_entries(expired)
         
         if removed_count > 0:
             logger.info(f"Disk cache cleanup: Removed {removed_count} expired files.")
         self.stats['cleanup_runs'] += 1
-        self.stats['last_cleanup'] = current_time.isoformat()
+        self.stats['last_cleanup'] = datetime.fromtimestamp(current_time).isoformat()
         return removed_count
     
     async def cleanup_oldest_files(self, target_size_mb: int) -> int:
-        """Clean up oldest files to reduce cache size."""
+        """Clean up oldest files to reduce cache size.
+        
+        Concurrent calls for the same target share one run.
+        """
         if not self.enabled:
             return 0
         
-        current_stats = await self.get_cache_stats()
-        current_size_mb = current_stats['total_size_mb']
+        return await self._single_flight(
+            ('oldest', target_size_mb), lambda: self._cleanup_oldest_files(target_size_mb)
+        )
+    
+    async def _cleanup_oldest_files(self, target_size_mb: int) -> int:
+        # Size is taken from the in-memory index (payload bytes), the same
+        # measure the evictions below subtract, so no directory walk is needed
+        await self._ensure_index()
+        current_size_bytes = sum(entry.file_size for entry in self._index.values())
+        target_size_bytes = target_size_mb * 1024 * 1024
         
-        if current_size_mb <= target_size_mb:
+        if current_size_bytes <= target_size_bytes:
             return 0
         
-        logger.info(f"Disk cache exceeding max size. Current: {current_size_mb:.2f}MB, Target: {target_size_mb}MB. Cleaning oldest files.")
+        logger.info(f"Disk cache exceeding max size. Current: {current_size_bytes / (1024 * 1024):.2f}MB, Target: {target_size_mb}MB. Cleaning oldest files.")
         
-        # Collect all files with their access times
-        files_to_delete = []
-        for format_dir in self.cache_dir.iterdir():
-            if not format_dir.is_dir():
-                continue
-            
-            for file_path in format_dir.iterdir():
-                if file_path.name.endswith('.meta'):
-                    try:
-                        async with aiofiles.open(file_path, 'r') as f:
-                            metadata = json.loads(await f.read())
-                        
-                        last_accessed_str = metadata.get('last_accessed', '')
-                        if last_accessed_str:
-                            last_accessed = datetime.fromisoformat(last_accessed_str)
-                        else:
-                            last_accessed = datetime.now()
-                        
-                        file_id = metadata.get('file_id', '')
-                        file_format = metadata.get('output_format', '')
-                        file_size = metadata.get('file_size', 0)
-                        
-                        files_to_delete.append((last_accessed, file_id, file_format, file_size))
-                    except Exception as e:
-                        logger.error(f"Error processing metadata file {file_path}: {e}")
-                        continue
-        
-        # Sort by last accessed (oldest first)
-        files_to_delete.sort()
-        
-        deleted_count = 0
+        # Pop least recently used entries off the heap until enough is freed
+        victims = []
         deleted_size_bytes = 0
         
-        for _, file_id, file_format, file_size in files_to_delete:
-            if current_size_mb - (deleted_size_bytes / (1024 * 1024)) <= target_size_mb:
-                break
-            
-            if await self.delete_file(file_id, file_format):
-                deleted_count += 1
-                deleted_size_bytes += file_size
+        while self._lru_heap and current_size_bytes - deleted_size_bytes > target_size_bytes:
+            last_accessed, file_id, file_format = heapq.heappop(self._lru_heap)
+            entry = self._index.get((file_id, file_format))
+            if entry is None or entry.last_accessed != last_accessed:
+                continue
+            victims.append((file_id, file_format))
+            deleted_size_bytes += entry.file_size
+        
+        deleted_count = await self._delete_entries(victims)
         
         if deleted_count > 0:
             logger.info(f"Disk cache cleanup: Removed {deleted_count} oldest files, freed {deleted_size_bytes / (1024 * 1024):.2f} MB.")
@@ -327,14 +834,17 @@ class DiskCacheService:
         deleted_count = 0
         for format_dir in self.cache_dir.iterdir():
             if format_dir.is_dir():
-                for file_path in format_dir.iterdir():
-                    if file_path.is_file():
-                        try:
-                            file_path.unlink()
-                            deleted_count += 1
-                        except OSError as e:
-                            logger.error(f"Error clearing file {file_path} from disk cache: {e}")
+                try:
+                    deleted_count += await asyncio.to_thread(_clear_format_dir_sync, format_dir)
+                except OSError as e:
+                    logger.error(f"Error clearing {format_dir} from disk cache: {e}")
         
+        self._index.clear()
+        self._accessed.clear()
+        self._lru_heap.clear()
+        self._ttl_heap.clear()
+        self._mem.clear()
+        self._mem_bytes = 0
         logger.info(f"Disk cache cleared. Removed {deleted_count} files.")
         self.stats = {
             'cache_hits': 0, 'cache_misses': 0, 'files_created': 0,
@@ -351,12 +861,4 @@ class DiskCacheService:
     
     def _get_mime_type(self, file_format: str) -> str:
         """Get MIME type for file format."""
-        mime_types = {
-            'tgs': 'application/gzip',
-            'lottie': 'application/json',
-            'webp': 'image/webp',
-            'webm': 'video/webm',
-            'png': 'image/png',
-            'jpg': 'image/jpeg'
-        }
-        return mime_types.get(file_format, 'application/octet-stream')
+        return MIME_TYPES.get(file_format, 'application/octet-stream')
@@ -1,18 +1,175 @@
 """OpenAI service for generating sticker images."""
-import base64
+import asyncio
 import logging
+import struct
+from collections import OrderedDict
 from io import BytesIO
-from typing import Optional
+from typing import List, Optional, Tuple
 
+import pybase64
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from openai import APIError as OpenAIAPIError
 
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Parameters sent with every images.generate() call.
+# Note: DALL-E 3/2 don't support transparent background natively;
+# transparency is handled in post-processing if needed.
+BASE_REQUEST_PARAMS = {"n": 1}
+
+# Images with at most this many distinct colours are encoded losslessly,
+# at low effort (lossless "quality" is compression effort, not fidelity)
+LOSSLESS_MAX_COLORS = 64
+LOSSLESS_METHOD = 1
+LOSSLESS_QUALITY = 20
+
+# Shared keep-alive session for downloading generated images by URL, so
+# consecutive stickers reuse the TCP/TLS connection to the CDN.
+# requests.Session is safe to share across the executor threads for plain GETs.
+_http = requests.Session()
+_http.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=32,
+        # Transient CDN errors are retried on the warm connection instead of
+        # failing the whole (already paid for) generation
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"})
+        )
+    )
+)
+_http.headers["Connection"] = "keep-alive"
+
+
+def _is_webp(data: bytes) -> bool:
+    """Check the RIFF/WEBP magic without decoding."""
+    return data[:4] == b'RIFF' and data[8:12] == b'WEBP'
+
+
+def _webp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read the canvas size from a WebP header without decoding.
+
+    Handles simple lossy (VP8), lossless (VP8L) and extended (VP8X) files;
+    returns None for anything else or a truncated header.
+    """
+    if len(data) < 30 or not _is_webp(data):
+        return None
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and data[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and data[20] == 0x2F:
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return width, height
+    return None
+
+
+def _to_output_mode(img: Image.Image) -> Image.Image:
+    """
+    Keep an alpha channel only when the source has one;
+    opaque images stay RGB instead of being expanded.
+    """
+    has_alpha = (
+        img.mode in ('RGBA', 'LA', 'PA')
+        or 'transparency' in img.info
+    )
+    target_mode = 'RGBA' if has_alpha else 'RGB'
+    if img.mode != target_mode:
+        img = img.convert(target_mode)
+    return img
+
+
+def _pick_webp_params(img: Image.Image, method: int, quality: int) -> dict:
+    """
+    Choose the WebP encoder profile for an image.
+
+    Flat, few-colour artwork (classic sticker style) comes out smaller and
+    faster as fast-effort lossless; everything else uses lossy with the
+    configured method/quality. getcolors() stops counting past the limit,
+    so photographic images bail out early.
+    """
+    if settings.webp_adaptive_lossless and img.getcolors(LOSSLESS_MAX_COLORS) is not None:
+        return {'lossless': True, 'method': LOSSLESS_METHOD, 'quality': LOSSLESS_QUALITY}
+    return {'lossless': False, 'method': method, 'quality': quality}
+
+
+def _encode_webp(img: Image.Image, method: int, quality: int) -> bytes:
+    """Encode an image as WebP (with transparency when present)."""
+    output = BytesIO()
+    img.save(output, format='WEBP', **_pick_webp_params(img, method, quality))
+    return output.getvalue()
+
+
+def _scale_to_webp(
+    source,
+    width: int,
+    height: int,
+    method: int,
+    quality: int,
+    fast_reduce: bool = False
+) -> bytes:
+    """
+    Decode an image from a file-like object, scale it and encode it as WebP.
+
+    Kept free of service state so it can run on any worker thread; Pillow
+    releases the GIL while decoding, resampling and encoding.
+    """
+    img = Image.open(source)
+
+    # Let libjpeg decode at a reduced DCT scale; the exact
+    # target size is still produced by the resize below.
+    # PNG/WebP have no draft mode, so this is JPEG-only.
+    if img.format == 'JPEG':
+        img.draft('RGB', (width, height))
+
+    img = _to_output_mode(img)
+
+    # Exact integer downscales (e.g. 1024x1024 -> 512x512) can use Pillow's
+    # box reduce, which is much cheaper than Lanczos at these ratios;
+    # anything else falls back to high-quality Lanczos resampling.
+    # The result is rebound to img so the full-size frame is freed before
+    # encoding instead of living alongside the scaled one.
+    src_width, src_height = img.size
+    factor = src_width // width
+    if (
+        fast_reduce
+        and factor > 1
+        and src_width == width * factor
+        and src_height == height * factor
+    ):
+        img = img.reduce(factor)
+    elif img.size != (width, height):
+        # reducing_gap lets Pillow box-reduce first on large ratios
+        # (>= 4x) and run Lanczos on the smaller intermediate
+        img = img.resize(
+            (width, height),
+            Image.Resampling.LANCZOS,
+            reducing_gap=2.0
+        )
+
+    return _encode_webp(img, method, quality)
+
+
+def _transcode_to_webp(data: bytes, method: int, quality: int) -> bytes:
+    """Re-encode an image (e.g. PNG from the API) as WebP at its own size."""
+    img = _to_output_mode(Image.open(BytesIO(data)))
+    return _encode_webp(img, method, quality)
+
 
 class OpenAIService:
     """Service for interacting with OpenAI API to generate sticker images."""
@@ -24,7 +181,10 @@ class OpenAIService:
         try:
             # Initialize client with only api_key to avoid issues with proxies parameter
             # httpx 0.28+ removed proxies parameter, so we explicitly pass only api_key
-            self.client = OpenAI(api_key=settings.openai_api_key)
+            self.client = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                http_client=self._create_http_client()
+            )
         except TypeError as e:
             if "proxies" in str(e):
                 logger.error(
@@ -33,8 +193,36 @@ class OpenAIService:
                     "Please ensure httpx==0.27.2 is installed."
                 )
             raise ValueError(f"Failed to initialize OpenAI client: {str(e)}") from e
+
+        # LRU of finished images keyed by (model, prompt, size), bounded by bytes
+        self._generated: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self._generated_bytes = 0
+        self._generated_max_bytes = settings.openai_generation_cache_mb * 1024 * 1024
+
+        # Bounds how many calls a bulk generate_stickers() keeps in flight
+        self._batch_semaphore = asyncio.Semaphore(settings.openai_max_concurrent_generations)
+    
+    async def close(self):
+        """Close the OpenAI client and its HTTP connection pool."""
+        await self.client.close()
+        logger.debug("Closed OpenAI client")
+    
+    @staticmethod
+    def _create_http_client() -> Optional[DefaultAsyncHttpxClient]:
+        """
+        Build an HTTP/2 client so concurrent generations share one TLS
+        connection; returns None (SDK default, HTTP/1.1) when disabled or
+        when the h2 package is not installed.
+        """
+        if not settings.openai_http2:
+            return None
+        try:
+            return DefaultAsyncHttpxClient(http2=True)
+        except ImportError:
+            logger.warning("h2 package not available, OpenAI client will use HTTP/1.1")
+            return None
     
-    def generate_sticker(
+    async def generate_sticker(
         self,
         prompt: str,
         model: str = "dall-e-3",
@@ -59,6 +247,16 @@ class OpenAIService:
             OpenAIAPIError: If OpenAI API call fails
             ValueError: If response data is invalid
         """
+        cache_key = (model, prompt, size)
+        cached = self._generated.get(cache_key)
+        if cached is not None:
+            self._generated.move_to_end(cache_key)
+            logger.info(
+                "Returning cached sticker image: model=%s, size=%s, %d bytes",
+                model, size, len(cached)
+            )
+            return cached
+
         requested_size = size
         api_size = size
         needs_scaling = False
@@ -66,56 +264,51 @@ class OpenAIService:
         target_height = None
         
         # Determine target size and scaling needs
-        if size == "512x512":
-            # For 512x512, always generate at 1024x1024 and scale down
+        native_sizes = settings.openai_native_sizes.get(model, ())
+        if size == "512x512" and size not in native_sizes:
+            # Models without a native 512x512 generate at 1024x1024 and scale down
             api_size = "1024x1024"
             needs_scaling = True
             target_width = 512
             target_height = 512
             logger.info(
-                f"Size 512x512 requested - will generate at 1024x1024 and scale down to 512x512"
+                "Size 512x512 requested - model %s will generate at 1024x1024 "
+                "and scale down to 512x512", model
             )
         
         try:
-            # Prepare request parameters
+            # Prepare request parameters on top of the shared constant ones
             request_params = {
+                **BASE_REQUEST_PARAMS,
                 "model": model,
                 "prompt": prompt,
                 "size": api_size,
-                "n": 1
+                # b64_json returns the image inline; "url" skips the base64
+                # inflation and decode and downloads the image instead
+                "response_format": settings.openai_response_format,
             }
             
-            # Add model-specific parameters
-            # DALL-E 3 supports response_format (but not background parameter)
-            # Note: DALL-E 3/2 don't support transparent background natively
-            # Transparency will be handled in post-processing if needed
-            if model == "dall-e-3" or model == "dall-e-2":
-                request_params["response_format"] = "b64_json"
-            # For other models, try to use response_format if supported
-            else:
-                try:
-                    request_params["response_format"] = "b64_json"
-                except:
-                    pass  # Some models may not support this
-            
             # Add optional user parameter
             if user:
                 request_params["user"] = user
             
             # Log the exact request being sent to OpenAI
+            # Lazy %-formatting: the prompt slice and params repr are only
+            # built when INFO is enabled
             logger.info(
-                f"OpenAI API request - calling images.generate() with model={model}, "
-                f"prompt='{prompt[:100]}{'...' if len(prompt) > 100 else ''}', "
-                f"requested_size={requested_size}, api_size={api_size}, "
-                f"needs_scaling={needs_scaling}, params={request_params}"
+                "OpenAI API request - calling images.generate() with model=%s, "
+                "prompt='%.100s%s', requested_size=%s, api_size=%s, "
+                "needs_scaling=%s, params=%r",
+                model, prompt, '...' if len(prompt) > 100 else '',
+                requested_size, api_size, needs_scaling, request_params
             )
             
             # Call OpenAI API
-            response = self.client.images.generate(**request_params)
+            response = await self.client.images.generate(**request_params)
             
             logger.debug(
-                f"OpenAI API response received: "
-                f"status=success, images_count={len(response.data) if response.data else 0}"
+                "OpenAI API response received: status=success, images_count=%d",
+                len(response.data) if response.data else 0
             )
             
             if not response.data or len(response.data) == 0:
@@ -123,66 +316,17 @@ class OpenAIService:
             
             image_data = response.data[0]
             
-            # Get image bytes
-            if hasattr(image_data, 'b64_json') and image_data.b64_json:
-                image_bytes = base64.b64decode(image_data.b64_json)
-                logger.info(
-                    f"Successfully generated sticker image from base64: "
-                    f"size={len(image_bytes)} bytes"
-                )
-            elif hasattr(image_data, 'url') and image_data.url:
-                logger.info(f"Downloading image from URL: {image_data.url}")
-                img_response = requests.get(image_data.url, timeout=30)
-                img_response.raise_for_status()
-                image_bytes = img_response.content
-                logger.info(
-                    f"Successfully downloaded sticker image: "
-                    f"size={len(image_bytes)} bytes, "
-                    f"content_type={img_response.headers.get('content-type', 'unknown')}"
-                )
-            else:
-                raise ValueError(
-                    f"OpenAI API response format not recognized. "
-                    f"Available attributes: {dir(image_data)}"
-                )
-            
-            # Scale down if needed (e.g., 512x512 from 1024x1024)
-            if needs_scaling and target_width and target_height:
-                logger.info(
-                    f"Scaling image from {api_size} to {target_width}x{target_height}"
-                )
-                try:
-                    img = Image.open(BytesIO(image_bytes))
-                    
-                    # Convert to RGBA for transparency support
-                    if img.mode != 'RGBA':
-                        img = img.convert('RGBA')
-                    
-                    # Resize using high-quality Lanczos resampling
-                    img_resized = img.resize(
-                        (target_width, target_height),
-                        Image.Resampling.LANCZOS
-                    )
-                    
-                    # Save back to WebP format with transparency
-                    output = BytesIO()
-                    img_resized.save(
-                        output,
-                        format='WEBP',
-                        method=6,  # Best quality
-                        lossless=False
-                    )
-                    image_bytes = output.getvalue()
-                    
-                    logger.info(
-                        f"Successfully scaled image: "
-                        f"original={api_size}, scaled={target_width}x{target_height}, "
-                        f"final_size={len(image_bytes)} bytes"
-                    )
-                except Exception as e:
-                    logger.error(f"Error scaling image: {e}")
-                    raise ValueError(f"Failed to scale image: {str(e)}") from e
-            
+            # Decoding, downloading and scaling are blocking; run them on a
+            # worker thread so the event loop stays free
+            image_bytes = await asyncio.to_thread(
+                self._materialize_image,
+                image_data,
+                needs_scaling,
+                api_size,
+                target_width,
+                target_height
+            )
+            self._remember_generated(cache_key, image_bytes)
             return image_bytes
             
         except OpenAIAPIError as e:
@@ -198,3 +342,148 @@ class OpenAIService:
             )
             raise ValueError(f"Failed to generate sticker: {str(e)}") from e
 
+    async def generate_stickers(
+        self,
+        prompts: List[str],
+        model: str = "dall-e-3",
+        quality: str = "high",
+        size: str = "512x512",
+        user: Optional[str] = None
+    ) -> List[bytes]:
+        """
+        Generate several stickers concurrently (e.g. seeding a whole pack).
+
+        Calls overlap their API latency but at most
+        settings.openai_max_concurrent_generations run at once, so a large
+        batch doesn't trip OpenAI rate limits. Repeated prompts within the
+        batch are generated once. The batch fails fast: on the first error
+        the remaining generations are cancelled before it is re-raised.
+        
+        Args:
+            prompts: Text prompts, one per sticker
+            model, quality, size, user: As for generate_sticker
+            
+        Returns:
+            List of WebP image bytes in the same order as prompts
+            
+        Raises:
+            OpenAIAPIError: If any OpenAI API call fails
+            ValueError: If any response data is invalid
+        """
+        async def generate_one(prompt: str) -> bytes:
+            async with self._batch_semaphore:
+                return await self.generate_sticker(prompt, model, quality, size, user)
+        
+        unique_prompts = list(dict.fromkeys(prompts))
+        tasks = [asyncio.create_task(generate_one(p)) for p in unique_prompts]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop paying for generations whose batch already failed and
+            # retrieve their outcomes so nothing is left unobserved
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        by_prompt = dict(zip(unique_prompts, results))
+        return [by_prompt[p] for p in prompts]
+
+    def _remember_generated(self, key: Tuple[str, str, str], image_bytes: bytes) -> None:
+        """Cache a generated image, evicting least recently used ones."""
+        if len(image_bytes) > self._generated_max_bytes:
+            return
+        previous = self._generated.pop(key, None)
+        if previous is not None:
+            self._generated_bytes -= len(previous)
+        self._generated[key] = image_bytes
+        self._generated_bytes += len(image_bytes)
+        while self._generated_bytes > self._generated_max_bytes:
+            _, evicted = self._generated.popitem(last=False)
+            self._generated_bytes -= len(evicted)
+
+    def _materialize_image(
+        self,
+        image_data,
+        needs_scaling: bool,
+        api_size: str,
+        target_width: Optional[int],
+        target_height: Optional[int]
+    ) -> bytes:
+        """
+        Turn one generated image entry into final image bytes.
+
+        Blocking: decodes base64 or downloads the URL, then scales to WebP
+        when needed. Called from generate_sticker via asyncio.to_thread.
+        """
+        # Get image bytes
+        if hasattr(image_data, 'b64_json') and image_data.b64_json:
+            image_bytes = pybase64.b64decode(image_data.b64_json, validate=False)
+            logger.info(
+                "Successfully generated sticker image from base64: size=%d bytes",
+                len(image_bytes)
+            )
+        elif hasattr(image_data, 'url') and image_data.url:
+            logger.info("Downloading image from URL: %s", image_data.url)
+            # Pillow buffers non-seekable sources in full anyway, so the body
+            # is read as bytes; the with block returns the connection to the
+            # pool on every path, including a failed raise_for_status()
+            with _http.get(image_data.url, timeout=30) as img_response:
+                img_response.raise_for_status()
+                image_bytes = img_response.content
+                logger.info(
+                    "Successfully downloaded sticker image: "
+                    "size=%d bytes, content_type=%s",
+                    len(image_bytes),
+                    img_response.headers.get('content-type', 'unknown')
+                )
+        else:
+            raise ValueError(
+                f"OpenAI API response format not recognized. "
+                f"Available attributes: {dir(image_data)}"
+            )
+
+        # A WebP that already has the target size needs no scaling
+        if needs_scaling and _webp_size(image_bytes) == (target_width, target_height):
+            logger.info("Image is already a %dx%d WebP, skipping scaling", target_width, target_height)
+            needs_scaling = False
+
+        # Scale down if needed (e.g., 512x512 from 1024x1024)
+        if needs_scaling and target_width and target_height:
+            logger.info(
+                "Scaling image from %s to %dx%d",
+                api_size, target_width, target_height
+            )
+            try:
+                image_bytes = _scale_to_webp(
+                    BytesIO(image_bytes),
+                    target_width,
+                    target_height,
+                    settings.webp_encode_method,
+                    settings.webp_encode_quality,
+                    settings.use_fast_reduce,
+                )
+
+                logger.info(
+                    "Successfully scaled image: "
+                    "original=%s, scaled=%dx%d, final_size=%d bytes",
+                    api_size, target_width, target_height, len(image_bytes)
+                )
+            except Exception as e:
+                logger.error(f"Error scaling image: {e}")
+                raise ValueError(f"Failed to scale image: {str(e)}") from e
+        elif not _is_webp(image_bytes):
+            # Already the requested size, but callers expect WebP
+            try:
+                image_bytes = _transcode_to_webp(
+                    image_bytes,
+                    settings.webp_encode_method,
+                    settings.webp_encode_quality,
+                )
+                logger.info(
+                    "Transcoded image to WebP: size=%d bytes", len(image_bytes)
+                )
+            except Exception as e:
+                logger.error(f"Error transcoding image: {e}")
+                raise ValueError(f"Failed to transcode image: {str(e)}") from e
+
+        return image_bytes
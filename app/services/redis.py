@@ -1,13 +1,17 @@
-import json
 import logging
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+import orjson
 import redis.asyncio as redis
 from app.config import settings
 from app.models.responses import StickerCache, ImageCache, CacheStats
 
 logger = logging.getLogger(__name__)
 
+# SCAN page size hint and UNLINK batch size for keyspace sweeps
+SCAN_COUNT = 500
+UNLINK_BATCH_SIZE = 1000
+
 
 class RedisService:
     """Service for Redis operations."""
@@ -36,10 +40,11 @@ class RedisService:
                     redis_url = f"rediss://{settings.redis_host}:{settings.redis_port}/{settings.redis_database}"
                 
                 # Create Redis client with SSL
-                self.redis = redis.from_url(
+                self.connection_pool = redis.BlockingConnectionPool.from_url(
                     redis_url,
                     decode_responses=False,
                     max_connections=settings.redis_max_connections,
+                    timeout=settings.redis_pool_timeout,
                     socket_keepalive=settings.redis_socket_keepalive,
                     socket_connect_timeout=settings.redis_socket_connect_timeout,
                     retry_on_timeout=True,
@@ -47,6 +52,7 @@ class RedisService:
                     ssl_cert_reqs='none',
                     ssl_check_hostname=False
                 )
+                self.redis = redis.Redis(connection_pool=self.connection_pool)
                 logger.info("Connecting to Redis with SSL and connection pooling")
             else:
                 # Build Redis URL without SSL
@@ -56,15 +62,17 @@ class RedisService:
                     redis_url = f"redis://{settings.redis_host}:{settings.redis_port}/{settings.redis_database}"
                 
                 # Create Redis client without SSL
-                self.redis = redis.from_url(
+                self.connection_pool = redis.BlockingConnectionPool.from_url(
                     redis_url,
                     decode_responses=False,
                     max_connections=settings.redis_max_connections,
+                    timeout=settings.redis_pool_timeout,
                     socket_keepalive=settings.redis_socket_keepalive,
                     socket_connect_timeout=settings.redis_socket_connect_timeout,
                     retry_on_timeout=True,
                     health_check_interval=30
                 )
+                self.redis = redis.Redis(connection_pool=self.connection_pool)
                 logger.info("Connecting to Redis with connection pooling")
             
             # Test connection
@@ -78,11 +86,22 @@ class RedisService:
         """Disconnect from Redis and close connection pool."""
         if self.redis:
             await self.redis.close()
+            # A client built on an explicit pool does not close that pool itself
+            if self.connection_pool:
+                await self.connection_pool.disconnect()
             logger.info("Redis connection closed")
     
     def _get_cache_key(self, file_id: str) -> str:
-        """Generate cache key for file."""
+        """Generate cache key for file (holds the raw sticker bytes)."""
         return f"sticker:file:{file_id}"
+
+    def _get_meta_key(self, file_id: str) -> str:
+        """Generate cache key for the small JSON metadata of a cached file."""
+        return f"sticker:file:{file_id}:meta"
+    
+    async def _scan_keys(self, pattern: str) -> List[bytes]:
+        """Collect keys matching pattern with non-blocking SCAN (not KEYS)."""
+        return [key async for key in self.redis.scan_iter(match=pattern, count=SCAN_COUNT)]
     
     def _get_sticker_set_cache_key(self, name: str) -> str:
         """Generate cache key for sticker set."""
@@ -98,24 +117,16 @@ class RedisService:
             return None
         
         try:
-            key = self._get_cache_key(file_id)
-            cached_data = await self.redis.get(key)
+            # Raw bytes and metadata live under separate keys; fetch both in
+            # one round-trip. An entry only counts when both are present
+            # (entries from the old base64+JSON layout have no meta key).
+            file_data, cached_meta = await self.redis.mget(
+                self._get_cache_key(file_id),
+                self._get_meta_key(file_id)
+            )
             
-            if cached_data:
-                # Deserialize cached data
-                # Handle both bytes and str (for fakeredis compatibility)
-                try:
-                    if isinstance(cached_data, bytes):
-                        data = json.loads(cached_data.decode('utf-8'))
-                    else:
-                        data = json.loads(cached_data)
-                except (AttributeError, TypeError):
-                    # For fakeredis, might need to convert differently
-                    data = json.loads(str(cached_data, 'utf-8') if isinstance(cached_data, (bytes, bytearray)) else cached_data)
-                
-                # Convert base64 file_data back to bytes
-                import base64
-                file_data = base64.b64decode(data['file_data'])
+            if file_data is not None and cached_meta is not None:
+                data = orjson.loads(cached_meta)
                 
                 # Reconstruct StickerCache object
                 sticker_cache = StickerCache(
@@ -153,10 +164,8 @@ class RedisService:
             if not cached_data:
                 return None
 
-            if isinstance(cached_data, bytes):
-                data = json.loads(cached_data.decode("utf-8"))
-            else:
-                data = json.loads(cached_data)
+            # orjson accepts both bytes and str
+            data = orjson.loads(cached_data)
 
             import base64
             file_data = base64.b64decode(data["file_data"])
@@ -179,13 +188,9 @@ class RedisService:
             return False
         
         try:
-            key = self._get_cache_key(sticker_cache.file_id)
-            
-            # Serialize data for storage
-            import base64
-            data = {
+            # Metadata only; the sticker bytes are stored raw under their own key
+            meta = {
                 'file_id': sticker_cache.file_id,
-                'file_data': base64.b64encode(sticker_cache.file_data).decode('utf-8'),
                 'mime_type': sticker_cache.mime_type,
                 'file_name': sticker_cache.file_name,
                 'file_size': sticker_cache.file_size,
@@ -197,13 +202,12 @@ class RedisService:
                 'is_converted': sticker_cache.is_converted
             }
             
-            # Store with TTL
+            # Store both keys with TTL in a single round-trip
             ttl_seconds = self.ttl_days * 24 * 60 * 60
-            json_data = json.dumps(data)
-            # Ensure we pass bytes to setex for compatibility
-            if isinstance(json_data, str):
-                json_data = json_data.encode('utf-8')
-            await self.redis.setex(key, ttl_seconds, json_data)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.setex(self._get_cache_key(sticker_cache.file_id), ttl_seconds, sticker_cache.file_data)
+            pipe.setex(self._get_meta_key(sticker_cache.file_id), ttl_seconds, orjson.dumps(meta))
+            await pipe.execute()
             
             logger.info(f"Stored sticker {sticker_cache.file_id} in cache")
             return True
@@ -233,8 +237,7 @@ class RedisService:
 
             ttl_value = self.ttl_days if ttl_days is None else ttl_days
             ttl_seconds = ttl_value * 24 * 60 * 60
-            json_data = json.dumps(data)
-            await self.redis.setex(key, ttl_seconds, json_data.encode("utf-8"))
+            await self.redis.setex(key, ttl_seconds, orjson.dumps(data))
             return True
         except Exception as e:
             logger.error(f"Error storing image {image_cache.image_id} in cache: {e}")
@@ -246,8 +249,10 @@ class RedisService:
             return False
         
         try:
-            key = self._get_cache_key(file_id)
-            result = await self.redis.delete(key)
+            result = await self.redis.delete(
+                self._get_cache_key(file_id),
+                self._get_meta_key(file_id)
+            )
             logger.info(f"Deleted sticker {file_id} from cache")
             return result > 0
         except Exception as e:
@@ -274,15 +279,15 @@ class RedisService:
         
         try:
             import asyncio
-            # Get all sticker keys with timeout to avoid hanging
-            pattern = "sticker:file:*"
+            # Get all sticker metadata keys with timeout to avoid hanging
+            pattern = "sticker:file:*:meta"
             try:
                 keys = await asyncio.wait_for(
-                    self.redis.keys(pattern),
-                    timeout=3.0  # 3 seconds timeout for keys operation
+                    self._scan_keys(pattern),
+                    timeout=3.0  # 3 seconds timeout for the keyspace scan
                 )
             except asyncio.TimeoutError:
-                logger.warning("Redis keys() operation timed out - too many keys")
+                logger.warning("Redis key scan timed out - too many keys")
                 # Return partial stats or None
                 return None
             
@@ -295,27 +300,24 @@ class RedisService:
             max_keys_to_process = 1000
             keys_to_process = keys[:max_keys_to_process]
             
-            for key in keys_to_process:
+            # Fetch all metadata blobs in one round-trip; they are small since
+            # sticker bytes live under separate keys
+            values = await self.redis.mget(keys_to_process) if keys_to_process else []
+            
+            for cached_meta in values:
+                if not cached_meta:
+                    continue
                 try:
-                    cached_data = await self.redis.get(key)
-                    if cached_data:
-                        # Handle both bytes and str (for fakeredis compatibility)
-                        try:
-                            if isinstance(cached_data, bytes):
-                                data = json.loads(cached_data.decode('utf-8'))
-                            else:
-                                data = json.loads(cached_data)
-                        except (AttributeError, TypeError):
-                            data = json.loads(str(cached_data, 'utf-8') if isinstance(cached_data, (bytes, bytearray)) else cached_data)
-                        total_size_bytes += data.get('file_size', 0)
-                        if data.get('is_converted', False):
-                            converted_files += 1
-                        
-                        # Count file types
-                        output_format = data.get('output_format', 'unknown')
-                        file_types[output_format] = file_types.get(output_format, 0) + 1
-                except Exception:
+                    data = orjson.loads(cached_meta)
+                except orjson.JSONDecodeError:
                     continue
+                total_size_bytes += data.get('file_size', 0)
+                if data.get('is_converted', False):
+                    converted_files += 1
+                
+                # Count file types
+                output_format = data.get('output_format', 'unknown')
+                file_types[output_format] = file_types.get(output_format, 0) + 1
             
             # If we processed fewer keys than total, adjust total_files
             if len(keys) > max_keys_to_process:
@@ -348,14 +350,8 @@ class RedisService:
             cached_data = await self.redis.get(key)
             
             if cached_data:
-                # Deserialize cached data
-                try:
-                    if isinstance(cached_data, bytes):
-                        data = json.loads(cached_data.decode('utf-8'))
-                    else:
-                        data = json.loads(cached_data)
-                except (AttributeError, TypeError):
-                    data = json.loads(str(cached_data, 'utf-8') if isinstance(cached_data, (bytes, bytearray)) else cached_data)
+                # Deserialize cached data (orjson accepts both bytes and str)
+                data = orjson.loads(cached_data)
                 
                 logger.info(f"Retrieved sticker set {name} from cache")
                 return data
@@ -377,8 +373,8 @@ class RedisService:
             
             # Store as JSON string with TTL = 1 day (86400 seconds)
             ttl_seconds = 86400  # 1 day
-            json_data = json.dumps(data)
-            json_bytes = json_data.encode('utf-8')
+            json_bytes = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+            json_data = json_bytes.decode('utf-8')
             
             # Try setex first (standard Redis)
             try:
@@ -406,18 +402,29 @@ class RedisService:
             return False
     
     async def clear_cache(self) -> int:
-        """Clear all cached stickers."""
+        """Clear all cached stickers; returns the number of stickers removed."""
         if not self.redis:
             return 0
         
         try:
-            pattern = "sticker:file:*"
-            keys = await self.redis.keys(pattern)
-            if keys:
-                deleted = await self.redis.delete(*keys)
-                logger.info(f"Cleared {deleted} stickers from cache")
-                return deleted
-            return 0
+            # SCAN + UNLINK in batches: neither blocks the Redis server on a
+            # large keyspace, and UNLINK frees the values in the background.
+            # Each sticker has a data and a :meta key, so stickers are
+            # counted by their meta keys rather than by keys unlinked.
+            stickers = 0
+            batch = []
+            async for key in self.redis.scan_iter(match="sticker:file:*", count=SCAN_COUNT):
+                batch.append(key)
+                if key.endswith(b":meta"):
+                    stickers += 1
+                if len(batch) >= UNLINK_BATCH_SIZE:
+                    await self.redis.unlink(*batch)
+                    batch = []
+            if batch:
+                await self.redis.unlink(*batch)
+            if stickers:
+                logger.info(f"Cleared {stickers} stickers from cache")
+            return stickers
         except Exception as e:
             logger.error(f"Error clearing cache: {e}")
             return 0
@@ -431,10 +438,9 @@ class RedisService:
             # Redis automatically removes expired keys, but we can check and remove manually
             # This is mainly for statistics/logging purposes
             pattern = "sticker:file:*"
-            keys = await self.redis.keys(pattern)
             expired_count = 0
             
-            for key in keys:
+            async for key in self.redis.scan_iter(match=pattern, count=SCAN_COUNT):
                 ttl = await self.redis.ttl(key)
                 if ttl == -2:  # Key doesn't exist (already expired)
                     expired_count += 1
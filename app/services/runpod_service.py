@@ -1,13 +1,13 @@
 """RunPod service for generating stickers via Snapstix."""
-import json
 import logging
 import os
 import ssl
 import uuid
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 import aiohttp
+import orjson
 from aiohttp import ClientTimeout
 
 from app.config import settings
@@ -16,18 +16,44 @@ logger = logging.getLogger(__name__)
 
 # Create a separate logger for detailed API interactions
 api_logger = logging.getLogger(f"{__name__}.api")
-api_logger.setLevel(logging.DEBUG)
+api_logger.setLevel(logging.DEBUG if settings.runpod_api_detailed_logging else logging.INFO)
 
 # Template file path (example.json in project root)
 TEMPLATE_PATH = Path(__file__).parent.parent.parent / "example.json"
 
 
+def _compile_template(template: Any) -> List[Tuple[Tuple[Any, ...], str]]:
+    """
+    Find every string in the template that contains a placeholder.
+    
+    Returns:
+        List of (path, template_string) pairs, where path is the sequence of
+        dict keys / list indexes leading to the string
+    """
+    sites: List[Tuple[Tuple[Any, ...], str]] = []
+    
+    def walk(obj: Any, path: Tuple[Any, ...]) -> None:
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                walk(value, path + (key,))
+        elif isinstance(obj, list):
+            for index, item in enumerate(obj):
+                walk(item, path + (index,))
+        elif isinstance(obj, str) and "{{" in obj:
+            sites.append((path, obj))
+    
+    walk(template, ())
+    return sites
+
+
 class RunPodService:
     """Service for interacting with RunPod API to generate stickers via Snapstix."""
     
     def __init__(self):
         """Initialize RunPod service."""
         self.template_cache: Optional[Dict[str, Any]] = None
+        # Placeholder locations in template_cache, found once at load time
+        self._template_sites: List[Tuple[Tuple[Any, ...], str]] = []
         self._session: Optional[aiohttp.ClientSession] = None
         self.api_url = settings.runpod_api_url
         self.api_token = settings.runpod_api_token
@@ -60,11 +86,12 @@ class RunPodService:
         
         try:
             with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
-                template = json.load(f)
+                template = orjson.loads(f.read())
             self.template_cache = template
+            self._template_sites = _compile_template(template)
             logger.info(f"Loaded template from {TEMPLATE_PATH}")
             return template
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in template file: {e}") from e
         except Exception as e:
             raise ValueError(f"Failed to load template file: {e}") from e
@@ -80,27 +107,34 @@ class RunPodService:
             callback_url: Callback URL
             
         Returns:
-            Dictionary with substituted values
+            Dictionary with substituted values (subtrees without placeholders
+            are shared with the template and must not be mutated)
         """
-        # Deep copy template to avoid modifying the original
-        payload = json.loads(json.dumps(template))
+        # Only the placeholder strings change between requests. Their paths
+        # are known from load time, so instead of walking the whole template,
+        # copy just the containers along each path (copy-on-write) and share
+        # everything else with the template, which is never modified.
+        if template is self.template_cache:
+            sites = self._template_sites
+        else:
+            sites = _compile_template(template)
         
-        # Substitute placeholders in JSON structure
-        def replace_placeholders(obj: Any) -> Any:
-            if isinstance(obj, dict):
-                return {k: replace_placeholders(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [replace_placeholders(item) for item in obj]
-            elif isinstance(obj, str):
-                # Replace placeholders in strings
-                return (obj
-                       .replace("{{prompt}}", prompt)
-                       .replace("{{processing_id}}", processing_id)
-                       .replace("{{callback_url}}", callback_url))
-            else:
-                return obj
+        payload = dict(template)
+        for path, text in sites:
+            parent = payload
+            source = template
+            for key in path[:-1]:
+                source = source[key]
+                child = parent[key]
+                if child is source:
+                    child = dict(child) if isinstance(child, dict) else list(child)
+                    parent[key] = child
+                parent = child
+            parent[path[-1]] = (text
+                               .replace("{{prompt}}", prompt)
+                               .replace("{{processing_id}}", processing_id)
+                               .replace("{{callback_url}}", callback_url))
         
-        payload = replace_placeholders(payload)
         return payload
     
     async def _get_session(self) -> aiohttp.ClientSession:
@@ -116,9 +150,9 @@ class RunPodService:
             # Configure connector with SSL support (similar to telegram_enhanced.py)
             connector = aiohttp.TCPConnector(
                 limit=100,  # Connection pool limit
-                limit_per_host=10,  # Connections per host
+                limit_per_host=32,  # Concurrent generate_sticker calls share one host
                 ttl_dns_cache=300,  # DNS cache TTL
-                keepalive_timeout=30,
+                keepalive_timeout=60,  # Keep TLS connections warm between bursts
                 force_close=False,
                 enable_cleanup_closed=True,
                 ssl=ssl_context,  # Use SSL context
@@ -130,7 +164,9 @@ class RunPodService:
             timeout = ClientTimeout(total=30, connect=10, sock_read=10)
             self._session = aiohttp.ClientSession(
                 connector=connector,
-                timeout=timeout
+                timeout=timeout,
+                # Serialize json= request bodies with orjson instead of json
+                json_serialize=lambda obj: orjson.dumps(obj).decode('utf-8')
             )
             logger.debug("Created aiohttp session for RunPod API with SSL support")
         
@@ -200,21 +236,25 @@ class RunPodService:
         
         # Log request details
         api_logger.info(f"[{request_id}] 🌐 RunPod API Request")
-        api_logger.debug(f"[{request_id}] URL: {self.api_url}")
-        api_logger.debug(f"[{request_id}] Method: POST")
-        # Log headers without sensitive token (only show if token is present)
-        headers_log = dict(headers)
-        if "Authorization" in headers_log:
-            headers_log["Authorization"] = "Bearer ***"
-        api_logger.debug(f"[{request_id}] Headers: {headers_log}")
-        
-        # Log request payload (formatted JSON)
-        try:
-            payload_str = json.dumps(payload, indent=2, ensure_ascii=False)
-            api_logger.debug(f"[{request_id}] Request Payload:\n{payload_str}")
-        except Exception as e:
-            api_logger.warning(f"[{request_id}] Failed to format request payload: {e}")
-            api_logger.debug(f"[{request_id}] Request Payload (raw): {str(payload)[:500]}")
+        # Payload/header dumps are only built when debug output is on
+        # (settings.runpod_api_detailed_logging), not formatted and discarded
+        detailed_logging = api_logger.isEnabledFor(logging.DEBUG)
+        if detailed_logging:
+            api_logger.debug(f"[{request_id}] URL: {self.api_url}")
+            api_logger.debug(f"[{request_id}] Method: POST")
+            # Log headers without sensitive token (only show if token is present)
+            headers_log = dict(headers)
+            if "Authorization" in headers_log:
+                headers_log["Authorization"] = "Bearer ***"
+            api_logger.debug(f"[{request_id}] Headers: {headers_log}")
+            
+            # Log request payload (formatted JSON)
+            try:
+                payload_str = orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode('utf-8')
+                api_logger.debug(f"[{request_id}] Request Payload:\n{payload_str}")
+            except Exception as e:
+                api_logger.warning(f"[{request_id}] Failed to format request payload: {e}")
+                api_logger.debug(f"[{request_id}] Request Payload (raw): {str(payload)[:500]}")
         
         try:
             async with session.post(
@@ -223,23 +263,26 @@ class RunPodService:
                 headers=headers
             ) as response:
                 # Log response status and headers first
-                api_logger.debug(f"[{request_id}] Response Status: {response.status}")
-                api_logger.debug(f"[{request_id}] Response Headers: {dict(response.headers)}")
+                if detailed_logging:
+                    api_logger.debug(f"[{request_id}] Response Status: {response.status}")
+                    api_logger.debug(f"[{request_id}] Response Headers: {dict(response.headers)}")
                 
                 # Read response body (try JSON first, fallback to text)
                 response_text = await response.text()
                 response_data = None
                 
-                # Try to parse as JSON for logging
+                # Try to parse as JSON (used for logging and the result)
                 try:
-                    response_data = json.loads(response_text)
-                    # Log formatted JSON response
-                    response_str = json.dumps(response_data, indent=2, ensure_ascii=False)
-                    api_logger.debug(f"[{request_id}] Response Body:\n{response_str}")
-                except json.JSONDecodeError:
-                    # If not JSON, log raw text (truncated if too long)
-                    response_preview = response_text[:1000] + "..." if len(response_text) > 1000 else response_text
-                    api_logger.debug(f"[{request_id}] Response Body (raw, not JSON): {response_preview}")
+                    response_data = orjson.loads(response_text)
+                    if detailed_logging:
+                        # Log formatted JSON response
+                        response_str = orjson.dumps(response_data, option=orjson.OPT_INDENT_2).decode('utf-8')
+                        api_logger.debug(f"[{request_id}] Response Body:\n{response_str}")
+                except orjson.JSONDecodeError:
+                    if detailed_logging:
+                        # If not JSON, log raw text (truncated if too long)
+                        response_preview = response_text[:1000] + "..." if len(response_text) > 1000 else response_text
+                        api_logger.debug(f"[{request_id}] Response Body (raw, not JSON): {response_preview}")
                 
                 # Check HTTP status
                 if response.status != 200:
@@ -256,8 +299,8 @@ class RunPodService:
                 # Parse JSON response (if not already parsed)
                 if response_data is None:
                     try:
-                        response_data = json.loads(response_text)
-                    except json.JSONDecodeError as e:
+                        response_data = orjson.loads(response_text)
+                    except orjson.JSONDecodeError as e:
                         logger.error(f"[{request_id}] Failed to parse RunPod API response as JSON: {response_text[:200]}")
                         raise ValueError(f"Invalid JSON response from RunPod API: {e}") from e
                 
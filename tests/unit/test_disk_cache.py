@@ -1,13 +1,40 @@
 """Unit tests for disk cache service."""
+import asyncio
 import pytest
 import allure
 import json
-import aiofiles
+import time
+import aiosqlite
 from pathlib import Path
 from datetime import datetime, timedelta
 from app.services.disk_cache import DiskCacheService
 
 
+async def _create_legacy_metadata_db(db_path: Path, entries) -> None:
+    """Create a pre-epoch metadata DB (ISO timestamps) with (file_id, expires_at) rows."""
+    async with aiosqlite.connect(str(db_path)) as db:
+        await db.execute("""
+            CREATE TABLE cache_metadata (
+                file_id TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                file_format TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                original_size INTEGER,
+                converted INTEGER DEFAULT 0,
+                created_at TEXT NOT NULL,
+                expires_at TEXT NOT NULL,
+                PRIMARY KEY (file_id, file_format)
+            )
+        """)
+        for i, (file_id, expires_at) in enumerate(entries):
+            await db.execute(
+                "INSERT INTO cache_metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_id, f"h{i + 1}", "lottie", 10, 10, 0,
+                 datetime.now().isoformat(), expires_at.isoformat())
+            )
+        await db.commit()
+
+
 @allure.feature("Disk Cache")
 @allure.tag("cache", "disk", "unit")
 @pytest.mark.unit
@@ -138,13 +165,15 @@ class TestDiskCacheService:
         with allure.step("Manually expire file by modifying metadata in database"):
             # Simulate expiration by setting old expiry date in SQLite
             await disk_cache_service._ensure_db_connection()
-            expired_date = (datetime.now() - timedelta(days=1)).isoformat()
+            expired_date = time.time() - 86400
             await disk_cache_service._metadata_db.execute("""
                 UPDATE cache_metadata 
                 SET expires_at = ? 
                 WHERE file_id = ? AND file_format = ?
             """, (expired_date, file_id, file_format))
             await disk_cache_service._metadata_db.commit()
+            # Drop the in-process memo of the original expiry
+            disk_cache_service._expiry_cache.clear()
         
         with allure.step("Try to retrieve expired file"):
             retrieved = await disk_cache_service.get_file(file_id, file_format)
@@ -199,3 +228,310 @@ class TestDiskCacheService:
         with allure.step("Verify cleanup statistics"):
             assert disk_cache_service.stats['cleanup_runs'] >= 1
 
+
+    @allure.title("Legacy metadata migration")
+    @allure.description("Test that ISO-string timestamps are migrated to epoch seconds")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_legacy_metadata_migration(self, disk_cache_service):
+        """Test migration of a pre-epoch metadata database."""
+        db_path = disk_cache_service._get_metadata_db_path()
+        
+        with allure.step("Create legacy database with ISO timestamps"):
+            await _create_legacy_metadata_db(db_path, [
+                ("legacy_live", datetime.now() + timedelta(days=1)),
+                ("legacy_expired", datetime.now() - timedelta(days=1)),
+            ])
+        
+        with allure.step("Open database through the service"):
+            await disk_cache_service._ensure_db_connection()
+            async with disk_cache_service._metadata_db.execute("""
+                SELECT file_id, expires_at FROM cache_metadata ORDER BY file_id
+            """) as cursor:
+                rows = await cursor.fetchall()
+            await disk_cache_service.close_db()
+        
+        with allure.step("Verify timestamps are epoch seconds"):
+            expires = dict(rows)
+            assert isinstance(expires["legacy_live"], float)
+            assert expires["legacy_live"] > time.time()
+            assert expires["legacy_expired"] < time.time()
+    
+    @allure.title("Concurrent legacy metadata migration")
+    @allure.description("Test that workers opening a legacy database together migrate it exactly once")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_concurrent_legacy_metadata_migration(self, disk_cache_service):
+        """Test two services migrating the same legacy database at once."""
+        db_path = disk_cache_service._get_metadata_db_path()
+        
+        with allure.step("Create legacy database with ISO timestamps"):
+            await _create_legacy_metadata_db(db_path, [
+                ("legacy_live", datetime.now() + timedelta(days=1)),
+            ])
+        
+        other_service = DiskCacheService()
+        try:
+            with allure.step("Initialize both services concurrently"):
+                await asyncio.gather(
+                    disk_cache_service._ensure_db_connection(),
+                    other_service._ensure_db_connection()
+                )
+            
+            with allure.step("Verify the row was migrated once"):
+                async with other_service._metadata_db.execute("""
+                    SELECT file_id, expires_at FROM cache_metadata
+                """) as cursor:
+                    rows = await cursor.fetchall()
+                assert len(rows) == 1
+                assert rows[0][0] == "legacy_live"
+                assert isinstance(rows[0][1], float)
+        finally:
+            await disk_cache_service.close_db()
+            await other_service.close_db()
+    
+    @allure.title("Failed metadata migration is retried")
+    @allure.description("Test that a failed migration is rolled back and the connection reset")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_failed_metadata_migration_resets_connection(self, disk_cache_service):
+        """Test that a failing migration leaves no half-open connection."""
+        db_path = disk_cache_service._get_metadata_db_path()
+        
+        with allure.step("Create legacy table the migration cannot copy"):
+            async with aiosqlite.connect(str(db_path)) as db:
+                await db.execute("CREATE TABLE cache_metadata (file_id TEXT NOT NULL)")
+                await db.execute("INSERT INTO cache_metadata VALUES ('kept')")
+                await db.commit()
+        
+        with allure.step("Initialization fails and resets the connection"):
+            with pytest.raises(Exception):
+                await disk_cache_service._ensure_db_connection()
+            assert disk_cache_service._metadata_db is None
+        
+        with allure.step("Verify the legacy table was left untouched"):
+            async with aiosqlite.connect(str(db_path)) as db:
+                async with db.execute("SELECT file_id FROM cache_metadata") as cursor:
+                    assert await cursor.fetchall() == [("kept",)]
+                async with db.execute("PRAGMA user_version") as cursor:
+                    assert (await cursor.fetchone())[0] == 0
+    
+    @allure.title("Cleanup removes expired entries")
+    @allure.description("Test that cleanup deletes expired files and their metadata rows")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_cleanup_removes_expired_entries(self, disk_cache_service):
+        """Test that expired entries are removed by cleanup."""
+        with allure.step("Store files and expire two of them"):
+            for i in range(3):
+                await disk_cache_service.store_file(f"expire_batch_{i}", b"content", "webp")
+            await disk_cache_service._metadata_db.execute("""
+                UPDATE cache_metadata SET expires_at = ?
+                WHERE file_id IN ('expire_batch_0', 'expire_batch_1')
+            """, (time.time() - 60,))
+            await disk_cache_service._metadata_db.commit()
+        
+        with allure.step("Run cleanup"):
+            removed = await disk_cache_service.cleanup_expired_files()
+            assert removed == 2
+        
+        with allure.step("Verify expired files are gone and live file remains"):
+            assert not disk_cache_service._get_cache_path("expire_batch_0", "webp").exists()
+            assert not disk_cache_service._get_cache_path("expire_batch_1", "webp").exists()
+            assert await disk_cache_service.get_file("expire_batch_2", "webp") == b"content"
+            assert disk_cache_service.stats['files_deleted'] == 2
+    
+    @allure.title("Filesystem scan diagnostics")
+    @allure.description("Test that the filesystem scan counts sharded cache files per format")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_diagnostics_fs_scan(self, disk_cache_service):
+        """Test filesystem scan in diagnostics."""
+        with allure.step("Store files in two formats"):
+            await disk_cache_service.store_file("scan_1", b"12345", "webp")
+            await disk_cache_service.store_file("scan_2", b"123", "webp")
+            await disk_cache_service.store_file("scan_3", b"1", "png")
+        
+        with allure.step("Run diagnostics with filesystem scan"):
+            diagnostics = await disk_cache_service.get_diagnostics(include_fs=True)
+            fs_scan = diagnostics["fs_scan"]
+        
+        with allure.step("Verify scan results"):
+            assert fs_scan["fs_file_types_estimate"] == {"webp": 2, "png": 1}
+            assert fs_scan["fs_total_size_bytes_estimate"] == 9
+            assert fs_scan["truncated"] is False
+    
+    @allure.title("Incremental cache stats")
+    @allure.description("Test that stats track stores/deletes without rescanning the index")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_incremental_cache_stats(self, disk_cache_service):
+        """Test incremental stats maintenance."""
+        with allure.step("Prime stats and store files"):
+            await disk_cache_service.get_cache_stats()
+            await disk_cache_service.store_file("inc_stats_1", b"abcd", "webp")
+            await disk_cache_service.store_file("inc_stats_2", b"ab", "png")
+            await disk_cache_service.delete_file("inc_stats_2", "png")
+        
+        with allure.step("Verify stats reflect the changes"):
+            stats = await disk_cache_service.get_cache_stats()
+            assert stats['total_files'] == 1
+            assert stats['total_size_bytes'] == 4
+            assert stats['file_types'] == {"webp": 1}
+        
+        with allure.step("Verify rescan agrees with incremental counters"):
+            await disk_cache_service.rescan_stats()
+            stats = await disk_cache_service.get_cache_stats()
+            assert stats['total_files'] == 1
+            assert stats['file_types'] == {"webp": 1}
+    
+    @allure.title("Size-based cleanup removes oldest files")
+    @allure.description("Test that cleanup_oldest_files evicts the oldest entries first")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_cleanup_oldest_files(self, disk_cache_service):
+        """Test size-based eviction order."""
+        megabyte = b"x" * (1024 * 1024)
+        
+        with allure.step("Store three 1MB files with increasing creation time"):
+            for i in range(3):
+                await disk_cache_service.store_file(f"oldest_{i}", megabyte, "webm")
+                await disk_cache_service._metadata_db.execute(
+                    "UPDATE cache_metadata SET created_at = ? WHERE file_id = ?",
+                    (1000.0 + i, f"oldest_{i}")
+                )
+            await disk_cache_service._metadata_db.commit()
+        
+        with allure.step("Reduce cache to 1MB"):
+            removed = await disk_cache_service.cleanup_oldest_files(target_size_mb=1)
+            assert removed == 2
+        
+        with allure.step("Verify only the newest file remains"):
+            assert not disk_cache_service._get_cache_path("oldest_0", "webm").exists()
+            assert not disk_cache_service._get_cache_path("oldest_1", "webm").exists()
+            assert disk_cache_service._get_cache_path("oldest_2", "webm").exists()
+            stats = await disk_cache_service.get_cache_stats()
+            assert stats['total_files'] == 1
+    
+    @allure.title("Clear cache")
+    @allure.description("Test that clear_cache removes all files and metadata")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_clear_cache(self, disk_cache_service, temp_cache_dir):
+        """Test clearing the whole cache."""
+        with allure.step("Store files"):
+            for i in range(3):
+                await disk_cache_service.store_file(f"clear_{i}", b"content", "png")
+        
+        with allure.step("Add unrelated data and leftover trash to the cache directory"):
+            unrelated = temp_cache_dir / "shared"
+            unrelated.mkdir()
+            (unrelated / "keep.txt").write_bytes(b"not cache data")
+            (temp_cache_dir / ".trash-leftover").mkdir()
+        
+        with allure.step("Clear cache and wait for background removal"):
+            removed = await disk_cache_service.clear_cache()
+            assert removed == 3
+            await asyncio.gather(*disk_cache_service._trash_tasks)
+        
+        with allure.step("Verify only the cache's own directories were removed"):
+            assert [p for p in temp_cache_dir.iterdir() if p.is_dir()] == [unrelated]
+            assert (unrelated / "keep.txt").read_bytes() == b"not cache data"
+            assert await disk_cache_service.get_file("clear_0", "png") is None
+            stats = await disk_cache_service.get_cache_stats()
+            assert stats['total_files'] == 0
+        
+        with allure.step("Verify the cache is still writable"):
+            assert await disk_cache_service.store_file("clear_after", b"new", "png")
+            assert await disk_cache_service.get_file("clear_after", "png") == b"new"
+    
+    @allure.title("Store is create-only")
+    @allure.description("Test that storing an existing entry keeps the original file")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_store_existing_file(self, disk_cache_service):
+        """Test that a second store of the same entry is a no-op."""
+        with allure.step("Store the same entry twice"):
+            assert await disk_cache_service.store_file("store_twice", b"first", "webp")
+            assert await disk_cache_service.store_file("store_twice", b"second", "webp")
+        
+        with allure.step("Verify the first content wins and no temp files remain"):
+            assert await disk_cache_service.get_file("store_twice", "webp") == b"first"
+            cache_path = disk_cache_service._get_cache_path("store_twice", "webp")
+            assert [p.name for p in cache_path.parent.iterdir()] == [cache_path.name]
+            assert disk_cache_service.stats['files_created'] == 1
+    
+    @allure.title("In-memory expiry cache")
+    @allure.description("Test that known-fresh entries are served without the metadata query and stay consistent")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_expiry_cache(self, disk_cache_service):
+        """Test the in-process expiry LRU used by get_file."""
+        with allure.step("Store a file and verify its expiry is memoized"):
+            await disk_cache_service.store_file("expiry_lru", b"content", "webp")
+            assert ("expiry_lru", "webp") in disk_cache_service._expiry_cache
+        
+        with allure.step("Serve a hit from the memoized expiry"):
+            assert await disk_cache_service.get_file("expiry_lru", "webp") == b"content"
+        
+        with allure.step("Verify a file removed behind our back is reported as a miss"):
+            disk_cache_service._get_cache_path("expiry_lru", "webp").unlink()
+            assert await disk_cache_service.get_file("expiry_lru", "webp") is None
+            assert ("expiry_lru", "webp") not in disk_cache_service._expiry_cache
+        
+        with allure.step("Verify a stale memoized expiry falls back to the index"):
+            await disk_cache_service.store_file("expiry_stale", b"content", "webp")
+            disk_cache_service._expiry_cache[("expiry_stale", "webp")] = time.time() - 1
+            assert await disk_cache_service.get_file("expiry_stale", "webp") == b"content"
+            assert disk_cache_service._expiry_cache[("expiry_stale", "webp")] > time.time()
+        
+        with allure.step("Verify delete invalidates the memoized expiry"):
+            await disk_cache_service.delete_file("expiry_stale", "webp")
+            assert ("expiry_stale", "webp") not in disk_cache_service._expiry_cache
+    
+    @allure.title("Send cached file to a descriptor")
+    @allure.description("Test that sendfile_to copies a cached entry to a file descriptor")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_sendfile_to(self, disk_cache_service, temp_cache_dir):
+        """Test zero-copy sending of cached entries."""
+        content = b"sendfile content " * 100
+        
+        with allure.step("Store file"):
+            await disk_cache_service.store_file("sendfile_test", content, "webp")
+        
+        with allure.step("Send the whole file and a slice to an output file"):
+            out_path = temp_cache_dir / "out.bin"
+            with open(out_path, "wb") as out:
+                sent = await disk_cache_service.sendfile_to("sendfile_test", "webp", out.fileno())
+                assert sent == len(content)
+                sent = await disk_cache_service.sendfile_to(
+                    "sendfile_test", "webp", out.fileno(), offset=5, count=10
+                )
+                assert sent == 10
+            assert out_path.read_bytes() == content + content[5:15]
+        
+        with allure.step("Verify a missing entry is reported as None"):
+            with open(out_path, "wb") as out:
+                assert await disk_cache_service.sendfile_to("sendfile_missing", "webp", out.fileno()) is None
+    
+    @allure.title("Memory-mapped file view")
+    @allure.description("Test that get_file_view returns the cached content without copying")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_get_file_view(self, disk_cache_service):
+        """Test retrieving cached entries as memoryviews."""
+        with allure.step("Store files"):
+            await disk_cache_service.store_file("view_test", b"mapped content", "webp")
+            await disk_cache_service.store_file("view_empty", b"", "webp")
+        
+        with allure.step("Verify views match the stored content"):
+            view = await disk_cache_service.get_file_view("view_test", "webp")
+            assert isinstance(view, memoryview)
+            assert view.readonly
+            assert bytes(view) == b"mapped content"
+            empty = await disk_cache_service.get_file_view("view_empty", "webp")
+            assert bytes(empty) == b""
+        
+        with allure.step("Verify a missing entry is reported as None"):
+            assert await disk_cache_service.get_file_view("view_missing", "webp") is None
@@ -0,0 +1,281 @@
+"""Unit tests for enhanced disk cache service."""
+import asyncio
+import shutil
+import time
+
+import orjson
+import pytest
+import allure
+from pathlib import Path
+
+from app.config import settings
+from app.services.disk_cache_enhanced import (
+    DiskCacheService,
+    ENTRY_HEADER,
+    ENTRY_MAGIC,
+    _iter_format_files,
+    _read_entry_sync,
+    _read_header_sync,
+    _update_access_times_sync,
+    _write_entry_sync,
+)
+
+
+@pytest.fixture
+def enhanced_disk_cache(temp_cache_dir: Path, monkeypatch) -> DiskCacheService:
+    """Enhanced disk cache service instance with temporary directory."""
+    monkeypatch.setattr(settings, "disk_cache_dir", str(temp_cache_dir))
+    monkeypatch.setattr(settings, "disk_cache_enabled", True)
+    return DiskCacheService()
+
+
+def _entry_meta(file_id: str, now: float) -> dict:
+    return {
+        'file_id': file_id, 'output_format': "webp", 'mime_type': "image/webp",
+        'file_size': 7, 'created_at': now, 'expires_at': now + 3600, 'last_accessed': now,
+    }
+
+
+@allure.feature("Disk Cache")
+@allure.tag("cache", "disk", "unit")
+@pytest.mark.unit
+class TestEnhancedDiskCacheService:
+    """Test enhanced DiskCacheService functionality."""
+
+    @allure.title("Cleanup oldest files")
+    @allure.description("Test that least recently used entries are evicted down to the target size")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_cleanup_oldest_files(self, enhanced_disk_cache):
+        """Test LRU eviction against the indexed payload size."""
+        payload = b"x" * (512 * 1024)
+
+        with allure.step("Store three 512 KB entries"):
+            for file_id in ("old", "mid", "new"):
+                assert await enhanced_disk_cache.set_file(file_id, "webp", payload, "image/webp")
+
+        with allure.step("Touch the oldest entry so it becomes most recently used"):
+            enhanced_disk_cache._index[("old", "webp")].last_accessed += 1000
+            enhanced_disk_cache._rebuild_lru_heap()
+
+        with allure.step("Evict down to 1 MB"):
+            deleted = await enhanced_disk_cache.cleanup_oldest_files(1)
+            assert deleted == 1
+            assert ("mid", "webp") not in enhanced_disk_cache._index
+            assert await enhanced_disk_cache.get_file("old", "webp") == payload
+            assert await enhanced_disk_cache.get_file("new", "webp") == payload
+
+        with allure.step("Nothing to do once under the target"):
+            assert await enhanced_disk_cache.cleanup_oldest_files(1) == 0
+
+    @allure.title("Read legacy flat-layout entries")
+    @allure.description("Test that entries written before sharding are found and moved into their shard")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("index_loaded", [False, True])
+    async def test_legacy_flat_entries(self, enhanced_disk_cache, index_loaded):
+        """Test reading entries from the pre-sharding flat layout."""
+        if index_loaded:
+            # Entries show up after the index was built, as if written by another worker
+            await enhanced_disk_cache._ensure_index()
+
+        now = time.time()
+        format_dir = enhanced_disk_cache._format_dir("webp")
+
+        with allure.step("Write a flat entry with a header"):
+            header_path = enhanced_disk_cache._get_file_path("with_header", "webp")
+            _write_entry_sync(format_dir / header_path.name, b"header payload", {
+                'file_id': "with_header", 'output_format': "webp", 'mime_type': "image/webp",
+                'file_size': 14, 'created_at': now, 'expires_at': now + 3600, 'last_accessed': now,
+            })
+
+        with allure.step("Write a flat entry with a .meta sidecar"):
+            sidecar_path = enhanced_disk_cache._get_file_path("with_sidecar", "webp")
+            sidecar_meta_path = enhanced_disk_cache._get_metadata_path("with_sidecar", "webp")
+            (format_dir / sidecar_path.name).write_bytes(b"sidecar payload")
+            (format_dir / sidecar_meta_path.name).write_bytes(orjson.dumps({
+                'file_id': "with_sidecar", 'output_format': "webp", 'mime_type': "image/webp",
+                'file_size': 15, 'expires_at': now + 3600, 'last_accessed': now,
+            }))
+
+        with allure.step("Read both entries back"):
+            assert await enhanced_disk_cache.get_file("with_header", "webp") == b"header payload"
+            assert await enhanced_disk_cache.get_file("with_sidecar", "webp") == b"sidecar payload"
+
+        with allure.step("Verify entries were moved into their shards"):
+            assert header_path.exists()
+            assert sidecar_path.exists() and sidecar_meta_path.exists()
+            assert not (format_dir / header_path.name).exists()
+            assert not (format_dir / sidecar_path.name).exists()
+            assert not (format_dir / sidecar_meta_path.name).exists()
+
+    @allure.title("Entry header round-trip")
+    @allure.description("Test that metadata written to the binary entry header reads back unchanged")
+    @allure.severity(allure.severity_level.CRITICAL)
+    def test_entry_header_round_trip(self, temp_cache_dir):
+        """Test header write/read round-trip."""
+        path = temp_cache_dir / "entry.webp"
+        meta = _entry_meta("round_trip", 1700000000.25)
+        _write_entry_sync(path, b"payload", meta)
+
+        assert path.read_bytes()[:4] == ENTRY_MAGIC
+        assert _read_header_sync(path) == meta
+        assert _read_entry_sync(path) == b"payload"
+
+    @allure.title("Rewrite last_accessed in place")
+    @allure.description("Test that only the last_accessed field of the header is overwritten")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_update_last_accessed_in_place(self, temp_cache_dir):
+        """Test in-place last_accessed rewrite."""
+        path = temp_cache_dir / "entry.webp"
+        meta = _entry_meta("touched", 1700000000.0)
+        _write_entry_sync(path, b"payload", meta)
+        size_before = path.stat().st_size
+
+        assert _update_access_times_sync([(path, 1800000000.5)]) == 1
+
+        assert path.stat().st_size == size_before
+        assert _read_header_sync(path) == {**meta, 'last_accessed': 1800000000.5}
+        assert _read_entry_sync(path) == b"payload"
+
+        with allure.step("Headerless and missing files are skipped"):
+            plain = temp_cache_dir / "plain.webp"
+            plain.write_bytes(b"x" * ENTRY_HEADER.size)
+            assert _update_access_times_sync([(plain, 1.0), (temp_cache_dir / "gone.webp", 1.0)]) == 0
+            assert plain.read_bytes() == b"x" * ENTRY_HEADER.size
+
+    @allure.title("Damaged entry header is a miss")
+    @allure.description("Test that a truncated or bad-magic header without a sidecar falls back to a cache miss")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("damage", ["bad_magic", "truncated_header", "truncated_info"])
+    async def test_damaged_header_is_miss(self, enhanced_disk_cache, damage):
+        """Test falling back to a miss on a damaged header."""
+        await enhanced_disk_cache._ensure_index()
+        path = enhanced_disk_cache._get_file_path("damaged", "webp")
+        _write_entry_sync(path, b"payload", _entry_meta("damaged", time.time()))
+        data = path.read_bytes()
+
+        if damage == "bad_magic":
+            data = b"XXXX" + data[4:]
+        elif damage == "truncated_header":
+            data = data[:ENTRY_HEADER.size - 1]
+        else:
+            data = data[:ENTRY_HEADER.size + 3]
+        path.write_bytes(data)
+
+        assert await enhanced_disk_cache.get_file("damaged", "webp") is None
+        assert enhanced_disk_cache.stats['cache_misses'] == 1
+
+    @allure.title("Memory cache eviction and size limit")
+    @allure.description("Test the in-process payload LRU budget and per-item limit")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_memory_cache_limits(self, enhanced_disk_cache, monkeypatch):
+        """Test memory cache eviction and oversize items."""
+        monkeypatch.setattr("app.services.disk_cache_enhanced.MEMORY_CACHE_MAX_BYTES", 25)
+        monkeypatch.setattr("app.services.disk_cache_enhanced.MEMORY_CACHE_MAX_ITEM_BYTES", 12)
+
+        with allure.step("Items over the per-item limit stay on disk only"):
+            await enhanced_disk_cache.set_file("big", "webp", b"x" * 13, "image/webp")
+            assert ("big", "webp") not in enhanced_disk_cache._mem
+
+        with allure.step("Least recently used items are evicted over the budget"):
+            for file_id in ("a", "b"):
+                await enhanced_disk_cache.set_file(file_id, "webp", b"y" * 10, "image/webp")
+            await enhanced_disk_cache.get_file("a", "webp")  # a is now the most recent
+            await enhanced_disk_cache.set_file("c", "webp", b"z" * 10, "image/webp")
+
+            assert list(enhanced_disk_cache._mem) == [("a", "webp"), ("c", "webp")]
+            assert enhanced_disk_cache._mem_bytes == 20
+            assert await enhanced_disk_cache.get_file("b", "webp") == b"y" * 10
+
+    @allure.title("Memory cache invalidation")
+    @allure.description("Test that delete, expiry cleanup and clear drop payloads from memory")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_memory_cache_invalidation(self, enhanced_disk_cache):
+        """Test that stale payloads are never served from memory."""
+        for file_id in ("deleted", "expired", "cleared"):
+            await enhanced_disk_cache.set_file(file_id, "webp", file_id.encode(), "image/webp")
+
+        with allure.step("Delete"):
+            await enhanced_disk_cache.delete_file("deleted", "webp")
+            assert ("deleted", "webp") not in enhanced_disk_cache._mem
+            assert await enhanced_disk_cache.get_file("deleted", "webp") is None
+
+        with allure.step("Expiry cleanup"):
+            entry = enhanced_disk_cache._index[("expired", "webp")]
+            entry.expires_at = time.time() - 1
+            enhanced_disk_cache._ttl_heap.append((entry.expires_at, "expired", "webp"))
+            enhanced_disk_cache._ttl_heap.sort()
+            assert await enhanced_disk_cache.cleanup_expired_files() == 1
+            assert ("expired", "webp") not in enhanced_disk_cache._mem
+
+        with allure.step("Clear"):
+            await enhanced_disk_cache.clear_cache()
+            assert not enhanced_disk_cache._mem
+            assert enhanced_disk_cache._mem_bytes == 0
+            assert await enhanced_disk_cache.get_file("cleared", "webp") is None
+
+    @allure.title("Expiry heap skips stale entries")
+    @allure.description("Test that heap tuples whose expiry no longer matches the index are not deleted")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_expiry_heap_skips_stale_tuples(self, enhanced_disk_cache):
+        """Test lazy deletion in the expiry heap."""
+        await enhanced_disk_cache._ensure_index()
+        await enhanced_disk_cache.set_file("rewritten", "webp", b"old", "image/webp")
+        stale_expiry = time.time() - 1
+        # The heap still holds an old, already-passed expiry for the entry,
+        # while the index has the fresh one from the rewrite
+        enhanced_disk_cache._ttl_heap.append((stale_expiry, "rewritten", "webp"))
+        enhanced_disk_cache._ttl_heap.sort()
+
+        assert await enhanced_disk_cache.cleanup_expired_files() == 0
+        assert await enhanced_disk_cache.get_file("rewritten", "webp") == b"old"
+
+    @allure.title("Concurrent cleanups share one run")
+    @allure.description("Test that concurrent callers of the same cleanup join a single task")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_cleanup_single_flight(self, enhanced_disk_cache, monkeypatch):
+        """Test single-flight cleanup."""
+        runs = 0
+        release = asyncio.Event()
+
+        async def slow_cleanup(full_scan):
+            nonlocal runs
+            runs += 1
+            await release.wait()
+            return 7
+
+        monkeypatch.setattr(enhanced_disk_cache, "_cleanup_expired_files", slow_cleanup)
+
+        callers = [asyncio.create_task(enhanced_disk_cache.cleanup_expired_files()) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await asyncio.gather(*callers) == [7, 7, 7]
+        assert runs == 1
+        assert not enhanced_disk_cache._cleanup_tasks
+
+    @allure.title("Scan skips vanished shards")
+    @allure.description("Test that a shard directory removed during a scan does not fail the listing")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_iter_format_files_skips_vanished_shard(self, temp_cache_dir):
+        """Test that a shard deleted mid-scan is skipped."""
+        format_dir = temp_cache_dir / "webp"
+        for shard in ("aa", "bb"):
+            (format_dir / shard).mkdir(parents=True)
+            (format_dir / shard / f"{shard}01.webp").write_bytes(b"payload")
+
+        names = []
+        for entry in _iter_format_files(format_dir):
+            names.append(entry.name)
+            # Delete the other shard mid-scan, as a concurrent clear_cache would
+            for shard in ("aa", "bb"):
+                if not entry.path.startswith(str(format_dir / shard)):
+                    shutil.rmtree(format_dir / shard, ignore_errors=True)
+
+        assert len(names) == 1
@@ -0,0 +1,71 @@
+"""Unit tests for image combiner."""
+import pytest
+import allure
+from unittest.mock import patch
+from PIL import Image
+
+from app.services import image_combiner
+from app.services.image_combiner import _fit_to_square, combine_images
+
+
+@allure.feature("Image Combiner")
+@allure.tag("image", "combiner", "unit")
+@pytest.mark.unit
+class TestFitToSquare:
+    """Test tile resizing for combined images."""
+
+    @allure.title("Fit to square - resampling filter by scale")
+    @allure.description("Test output size, mode and resampling filter for downscales and upscales")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.parametrize("source_size, expected_size, expected_offset, expected_filter", [
+        ((200, 100), (128, 64), (0, 32), Image.Resampling.BILINEAR),   # mild downscale
+        ((100, 512), (25, 128), (51, 0), Image.Resampling.LANCZOS),    # strong downscale
+        ((64, 64), (128, 128), (0, 0), Image.Resampling.LANCZOS),      # upscale
+    ])
+    def test_fit_to_square_resize(self, source_size, expected_size, expected_offset, expected_filter):
+        """Test resizing to fit a square tile."""
+        image = Image.new("RGBA", source_size, (255, 0, 0, 128))
+        original_resize = Image.Image.resize
+
+        with patch.object(Image.Image, "resize", autospec=True, side_effect=original_resize) as resize:
+            resized, x_offset, y_offset = _fit_to_square(image, 128)
+
+        assert resized.size == expected_size
+        assert resized.mode == "RGBA"
+        assert (x_offset, y_offset) == expected_offset
+        assert resize.call_args.args[2] == expected_filter
+
+    @allure.title("Fit to square - already square")
+    @allure.description("Test that an image already at the tile size is returned as is")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_fit_to_square_already_square(self):
+        """Test that no resize happens at the target size."""
+        image = Image.new("RGB", (128, 128), "blue")
+
+        resized, x_offset, y_offset = _fit_to_square(image, 128)
+
+        assert resized is image
+        assert resized.mode == "RGB"
+        assert (x_offset, y_offset) == (0, 0)
+
+
+@allure.feature("Image Combiner")
+@allure.tag("image", "combiner", "unit")
+@pytest.mark.unit
+class TestCombineImages:
+    """Test combining images into a grid."""
+
+    @allure.title("Combine images reuses the resize pool")
+    @allure.description("Test grid output and that consecutive calls share one thread pool")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_combine_images_shared_executor(self):
+        """Test that combine_images uses one module-level executor."""
+        images = [Image.new("RGB", (256, 128), "red") for _ in range(3)]
+
+        combined = combine_images(images, tile_size=64)
+        executor = image_combiner._resize_executor
+        combine_images(images, tile_size=64)
+
+        assert combined.size == (128, 128)
+        assert executor is not None
+        assert image_combiner._resize_executor is executor
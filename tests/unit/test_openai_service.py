@@ -0,0 +1,321 @@
+"""Unit tests for OpenAI service."""
+import asyncio
+
+import pybase64
+import pytest
+import allure
+import requests
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from PIL import Image
+
+from app.services.openai_service import (
+    LOSSLESS_METHOD,
+    LOSSLESS_QUALITY,
+    OpenAIService,
+    _pick_webp_params,
+    _scale_to_webp,
+    _webp_size,
+)
+
+
+def _encoded(mode: str, size, image_format: str) -> BytesIO:
+    """An image encoded in image_format, as a file-like source."""
+    color = (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)
+    buffer = BytesIO()
+    Image.new(mode, size, color).save(buffer, format=image_format)
+    buffer.seek(0)
+    return buffer
+
+
+def _api_response(data: bytes) -> SimpleNamespace:
+    """An images.generate() response carrying data as b64_json."""
+    return SimpleNamespace(data=[SimpleNamespace(b64_json=pybase64.b64encode(data).decode(), url=None)])
+
+
+@allure.feature("OpenAI Service")
+@allure.tag("openai", "service", "unit")
+@pytest.mark.unit
+class TestOpenAIService:
+    """Test OpenAIService functionality."""
+
+    @pytest.fixture
+    def service(self):
+        """Create OpenAIService instance with a dummy API key."""
+        with patch('app.services.openai_service.settings.openai_api_key', 'sk-test'):
+            return OpenAIService()
+
+    @allure.title("Generate stickers batch - all succeed")
+    @allure.description("Results follow prompt order and repeated prompts are generated once")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_generate_stickers_success(self, service):
+        """Test batch where every prompt succeeds."""
+        calls = []
+
+        async def fake_generate(prompt, *args):
+            calls.append(prompt)
+            return prompt.encode()
+
+        with patch.object(service, 'generate_sticker', side_effect=fake_generate):
+            results = await service.generate_stickers(["cat", "dog", "cat"])
+
+        assert results == [b"cat", b"dog", b"cat"]
+        assert sorted(calls) == ["cat", "dog"]
+
+    @allure.title("Generate stickers batch - one fails")
+    @allure.description("The first error is raised and the remaining generations are cancelled")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_generate_stickers_failure_cancels_rest(self, service):
+        """Test batch where one prompt fails."""
+        cancelled = []
+
+        async def fake_generate(prompt, *args):
+            if prompt == "bad":
+                raise ValueError("Failed to generate sticker: boom")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(prompt)
+                raise
+            return prompt.encode()
+
+        with patch.object(service, 'generate_sticker', side_effect=fake_generate):
+            with pytest.raises(ValueError, match="boom"):
+                await asyncio.wait_for(
+                    service.generate_stickers(["slow-1", "bad", "slow-2"]),
+                    timeout=5
+                )
+
+        assert sorted(cancelled) == ["slow-1", "slow-2"]
+
+    @allure.title("Failed image download releases the connection")
+    @allure.description("Test that the download response is closed when raise_for_status fails")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_materialize_image_closes_failed_download(self, service):
+        """Test that the URL response is closed on an HTTP error."""
+        response = MagicMock()
+        response.__enter__.return_value = response
+        response.raise_for_status.side_effect = requests.HTTPError("403 Forbidden")
+        image_data = SimpleNamespace(b64_json=None, url="https://cdn.example.com/img.png")
+
+        with patch('app.services.openai_service._http') as http:
+            http.get.return_value = response
+            with pytest.raises(requests.HTTPError):
+                service._materialize_image(image_data, True, "1024x1024", 512, 512)
+
+        response.__exit__.assert_called_once()
+
+    @allure.title("Generate sticker - cache hit")
+    @allure.description("Test that a repeated (model, prompt, size) is served without another API call")
+    @allure.severity(allure.severity_level.CRITICAL)
+    @pytest.mark.asyncio
+    async def test_generate_sticker_cache_hit(self, service):
+        """Test that the generation cache skips the API call."""
+        png = _encoded("RGB", (1024, 1024), "PNG").getvalue()
+        service.client.images.generate = AsyncMock(return_value=_api_response(png))
+
+        first = await service.generate_sticker("cat", model="gpt-image-1", size="1024x1024")
+        second = await service.generate_sticker("cat", model="gpt-image-1", size="1024x1024")
+
+        assert second is first
+        service.client.images.generate.assert_awaited_once()
+
+    @allure.title("Generate sticker - native size")
+    @allure.description("Test that a size the model supports natively is requested as is, without scaling")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_generate_sticker_native_size(self, service):
+        """Test that 512x512 is requested directly from dall-e-2."""
+        png = _encoded("RGB", (512, 512), "PNG").getvalue()
+        service.client.images.generate = AsyncMock(return_value=_api_response(png))
+
+        with patch('app.services.openai_service._scale_to_webp') as scale:
+            result = await service.generate_sticker("cat", model="dall-e-2", size="512x512")
+
+        assert service.client.images.generate.call_args.kwargs["size"] == "512x512"
+        scale.assert_not_called()
+        assert Image.open(BytesIO(result)).size == (512, 512)
+
+    @allure.title("Generate sticker - PNG transcoded to WebP")
+    @allure.description("Test that a PNG payload at the requested size is re-encoded as WebP")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_generate_sticker_transcodes_png(self, service):
+        """Test PNG to WebP transcoding."""
+        png = _encoded("RGBA", (1024, 1024), "PNG").getvalue()
+        service.client.images.generate = AsyncMock(return_value=_api_response(png))
+
+        result = await service.generate_sticker("cat", model="gpt-image-1", size="1024x1024")
+
+        image = Image.open(BytesIO(result))
+        assert image.format == "WEBP"
+        assert image.size == (1024, 1024)
+        assert image.mode == "RGBA"
+
+    @allure.title("Generate sticker - WebP passed through")
+    @allure.description("Test that a WebP payload at the requested size is returned unchanged")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("model, size, payload_size", [
+        ("gpt-image-1", "1024x1024", (1024, 1024)),   # native size
+        ("dall-e-3", "512x512", (512, 512)),          # scaling needed, but already 512x512
+    ])
+    async def test_generate_sticker_webp_passthrough(self, service, model, size, payload_size):
+        """Test that a WebP of the right size is not re-encoded."""
+        webp = _encoded("RGB", payload_size, "WEBP").getvalue()
+        service.client.images.generate = AsyncMock(return_value=_api_response(webp))
+
+        result = await service.generate_sticker("cat", model=model, size=size)
+
+        assert result == webp
+
+    @allure.title("Generation cache - LRU eviction")
+    @allure.description("Test that the least recently used images are evicted once over the byte budget")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_generation_cache_lru_eviction(self, service):
+        """Test byte-bounded LRU eviction."""
+        service._generated_max_bytes = 25
+        service._remember_generated(("m", "a", "s"), b"a" * 10)
+        service._remember_generated(("m", "b", "s"), b"b" * 10)
+        service._generated.move_to_end(("m", "a", "s"))  # a is now the most recent
+
+        service._remember_generated(("m", "c", "s"), b"c" * 10)
+
+        assert list(service._generated) == [("m", "a", "s"), ("m", "c", "s")]
+        assert service._generated_bytes == 20
+
+    @allure.title("Generation cache - oversize item")
+    @allure.description("Test that an image larger than the whole budget is not cached")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_generation_cache_skips_oversize(self, service):
+        """Test that oversize images are not cached and evict nothing."""
+        service._generated_max_bytes = 25
+        service._remember_generated(("m", "a", "s"), b"a" * 10)
+
+        service._remember_generated(("m", "big", "s"), b"x" * 26)
+
+        assert list(service._generated) == [("m", "a", "s")]
+        assert service._generated_bytes == 10
+
+    @allure.title("Generation cache - disabled")
+    @allure.description("Test that openai_generation_cache_mb=0 turns the cache off")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_generation_cache_disabled(self):
+        """Test that every request calls the API when the cache is off."""
+        with patch('app.services.openai_service.settings.openai_api_key', 'sk-test'), \
+                patch('app.services.openai_service.settings.openai_generation_cache_mb', 0):
+            service = OpenAIService()
+        webp = _encoded("RGB", (1024, 1024), "WEBP").getvalue()
+        service.client.images.generate = AsyncMock(return_value=_api_response(webp))
+
+        await service.generate_sticker("cat", model="gpt-image-1", size="1024x1024")
+        await service.generate_sticker("cat", model="gpt-image-1", size="1024x1024")
+
+        assert service.client.images.generate.await_count == 2
+        assert len(service._generated) == 0
+
+    @allure.title("Close OpenAI client")
+    @allure.description("Test that close() shuts down the client's HTTP connection pool")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_close(self, service):
+        """Test closing the OpenAI client."""
+        assert not service.client.is_closed()
+        await service.close()
+        assert service.client.is_closed()
+
+
+@allure.feature("OpenAI Service")
+@allure.tag("openai", "image", "unit")
+@pytest.mark.unit
+class TestOpenAIImageHelpers:
+    """Test the image scaling and WebP encoding helpers."""
+
+    @allure.title("Scale to WebP - resampling path")
+    @allure.description("Test output size and mode for reduce, Lanczos downscale, upscale and no-op scaling")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.parametrize("mode, source_size, image_format, fast_reduce, expected_path", [
+        ("RGB", (1024, 1024), "JPEG", True, None),          # JPEG draft decodes at 1/2 scale
+        ("RGBA", (1024, 1024), "PNG", True, "reduce"),      # exact 2x box reduce
+        ("RGBA", (1024, 1024), "PNG", False, "resize"),     # exact 2x without fast reduce
+        ("RGBA", (1000, 1000), "PNG", True, "resize"),      # non-integer ratio
+        ("RGB", (256, 256), "PNG", True, "resize"),         # upscale
+        ("RGBA", (512, 512), "PNG", True, None),            # already the target size
+    ])
+    def test_scale_to_webp(self, mode, source_size, image_format, fast_reduce, expected_path):
+        """Test scaling an encoded image to a 512x512 WebP."""
+        original_reduce = Image.Image.reduce
+        original_resize = Image.Image.resize
+
+        with patch.object(Image.Image, "reduce", autospec=True, side_effect=original_reduce) as reduce, \
+                patch.object(Image.Image, "resize", autospec=True, side_effect=original_resize) as resize:
+            data = _scale_to_webp(_encoded(mode, source_size, image_format), 512, 512, 4, 90, fast_reduce)
+
+        result = Image.open(BytesIO(data))
+        assert result.format == "WEBP"
+        assert result.size == (512, 512)
+        assert result.mode == mode
+        assert reduce.called == (expected_path == "reduce")
+        assert resize.called == (expected_path == "resize")
+        if expected_path == "resize":
+            first_call = resize.call_args_list[0]
+            assert first_call.args[2] == Image.Resampling.LANCZOS
+            assert first_call.kwargs["reducing_gap"] == 2.0
+
+    @allure.title("Adaptive WebP params - flat colour artwork")
+    @allure.description("Test that a few-colour image is encoded losslessly at low effort")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_pick_webp_params_flat_colour(self):
+        """Test that flat-colour images pick lossless."""
+        image = Image.new("RGBA", (64, 64), (0, 0, 0, 0))
+        image.paste((255, 200, 0, 255), (16, 16, 48, 48))
+
+        with patch('app.services.openai_service.settings.webp_adaptive_lossless', True):
+            params = _pick_webp_params(image, 4, 90)
+
+        assert params == {'lossless': True, 'method': LOSSLESS_METHOD, 'quality': LOSSLESS_QUALITY}
+
+    @allure.title("Adaptive WebP params - photographic image")
+    @allure.description("Test that a many-colour image keeps the configured lossy profile")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_pick_webp_params_photographic(self):
+        """Test that photographic images pick lossy."""
+        image = Image.merge("RGB", [Image.linear_gradient("L"), Image.effect_noise((256, 256), 40),
+                                    Image.linear_gradient("L").rotate(90)])
+
+        with patch('app.services.openai_service.settings.webp_adaptive_lossless', True):
+            params = _pick_webp_params(image, 4, 90)
+
+        assert params == {'lossless': False, 'method': 4, 'quality': 90}
+
+    @allure.title("WebP header size")
+    @allure.description("Test reading the canvas size from VP8, VP8L and VP8X headers")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.parametrize("mode, options, chunk", [
+        ("RGB", {}, b"VP8 "),
+        ("RGB", {"lossless": True}, b"VP8L"),
+        ("RGBA", {}, b"VP8X"),
+    ])
+    def test_webp_size(self, mode, options, chunk):
+        """Test parsing the WebP header without decoding."""
+        buffer = BytesIO()
+        Image.new(mode, (300, 200)).save(buffer, format="WEBP", **options)
+        data = buffer.getvalue()
+
+        assert data[12:16] == chunk
+        assert _webp_size(data) == (300, 200)
+
+    @allure.title("WebP header size - not a WebP")
+    @allure.description("Test that other formats and truncated headers return None")
+    @allure.severity(allure.severity_level.NORMAL)
+    def test_webp_size_invalid(self):
+        """Test that non-WebP data is rejected."""
+        buffer = BytesIO()
+        Image.new("RGB", (300, 200)).save(buffer, format="WEBP")
+
+        assert _webp_size(buffer.getvalue()[:20]) is None
+        assert _webp_size(_encoded("RGB", (300, 200), "PNG").getvalue()) is None
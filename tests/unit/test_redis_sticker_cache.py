@@ -0,0 +1,126 @@
+"""Unit tests for Redis sticker caching."""
+import base64
+import json
+import pytest
+import allure
+from datetime import datetime
+
+from app.models.responses import StickerCache
+
+
+def _sticker(file_id: str, file_data: bytes = b"\x00\x01raw sticker bytes\xff") -> StickerCache:
+    return StickerCache(
+        file_id=file_id,
+        file_data=file_data,
+        mime_type="application/json",
+        file_name=f"{file_id}.json",
+        file_size=len(file_data),
+        original_format="tgs",
+        output_format="lottie",
+        last_updated=datetime(2024, 1, 1, 12, 0, 0),
+        conversion_time_ms=42,
+        is_converted=True
+    )
+
+
+@allure.feature("Redis Service")
+@allure.tag("redis", "sticker", "cache", "unit")
+@pytest.mark.unit
+class TestRedisStickerCache:
+    """Test Redis sticker caching (raw bytes + JSON metadata keys)."""
+
+    @allure.title("Store and get sticker")
+    @allure.description("Test that a sticker round-trips through its data and meta keys")
+    @allure.severity(allure.severity_level.CRITICAL)
+    @pytest.mark.asyncio
+    async def test_store_and_get_sticker(self, fake_redis_service):
+        """Test sticker store/get round-trip."""
+        service = fake_redis_service
+        sticker = _sticker("file1")
+
+        assert await service.set_sticker(sticker) is True
+
+        with allure.step("Verify raw bytes and metadata are stored separately"):
+            assert await service.redis.get("sticker:file:file1") == sticker.file_data
+            meta = json.loads(await service.redis.get("sticker:file:file1:meta"))
+            assert meta["file_id"] == "file1"
+            assert "file_data" not in meta
+
+        with allure.step("Get sticker back"):
+            result = await service.get_sticker("file1")
+            assert result == sticker
+
+    @allure.title("Legacy sticker entry is a miss")
+    @allure.description("Test that an entry in the old base64+JSON layout is not served")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_legacy_entry_is_miss(self, fake_redis_service):
+        """Test that a legacy base64+JSON entry produces a cache miss."""
+        service = fake_redis_service
+        sticker = _sticker("legacy")
+        legacy = sticker.model_dump(mode="json", exclude={"file_data"})
+        legacy["file_data"] = base64.b64encode(sticker.file_data).decode("utf-8")
+
+        await service.redis.set("sticker:file:legacy", json.dumps(legacy))
+
+        assert await service.get_sticker("legacy") is None
+
+    @allure.title("Delete sticker")
+    @allure.description("Test that deleting a sticker removes both of its keys")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_delete_sticker(self, fake_redis_service):
+        """Test that delete removes the data and meta keys."""
+        service = fake_redis_service
+
+        assert await service.set_sticker(_sticker("file1")) is True
+
+        assert await service.delete_sticker("file1") is True
+        assert await service.redis.exists("sticker:file:file1", "sticker:file:file1:meta") == 0
+        assert await service.get_sticker("file1") is None
+
+    @allure.title("Clear cache counts stickers")
+    @allure.description("Test that clear_cache reports stickers removed, not keys")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_clear_cache_counts_stickers(self, fake_redis_service):
+        """Test that each sticker is counted once although it has two keys."""
+        service = fake_redis_service
+
+        for file_id in ("file1", "file2", "file3"):
+            assert await service.set_sticker(_sticker(file_id)) is True
+
+        assert await service.clear_cache() == 3
+        assert await service.get_sticker("file1") is None
+
+    @allure.title("Cache stats from meta keys")
+    @allure.description("Test that stats count each sticker once from its metadata")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_cache_stats(self, fake_redis_service):
+        """Test cache statistics over the data + meta layout."""
+        service = fake_redis_service
+        await service.set_sticker(_sticker("file1"))
+        await service.set_sticker(_sticker("file2", b"abc").model_copy(update={"is_converted": False}))
+
+        stats = await service.get_cache_stats()
+
+        assert stats.total_files == 2
+        assert stats.converted_files == 1
+        assert stats.original_files == 1
+        assert stats.total_size_bytes == len(_sticker("file1").file_data) + 3
+        assert stats.file_types == {"lottie": 2}
+
+    @allure.title("Cleanup restores missing TTLs")
+    @allure.description("Test that the SCAN sweep sets a TTL on sticker keys that have none")
+    @allure.severity(allure.severity_level.NORMAL)
+    @pytest.mark.asyncio
+    async def test_cleanup_expired_sets_missing_ttl(self, fake_redis_service):
+        """Test the cleanup sweep over sticker keys."""
+        service = fake_redis_service
+        await service.set_sticker(_sticker("file1"))
+        await service.redis.persist("sticker:file:file1")
+
+        assert await service.cleanup_expired_stickers() == 0
+        assert await service.redis.ttl("sticker:file:file1") > 0
+        assert await service.redis.ttl("sticker:file:file1:meta") > 0